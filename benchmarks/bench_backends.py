@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# Compare the ElementTree, lxml and expat parser backends of XmlParser
+# Usage: python benchmarks/bench_backends.py report.xml [report2.xml ...] [--repeat N]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import BACKENDS, XmlParser, get_backend, lxml_etree
+
+
+def run_tree(filepath, backend):
+    parser = XmlParser(filepath, backend=backend)
+    parser.clean_document()
+    return sum(1 for _ in parser.iter_findings())
+
+
+def run_streaming(filepath, backend):
+    parser = XmlParser(filepath, streaming=True, backend=backend)
+    return sum(1 for _ in parser.stream_findings())
+
+
+def best_of(func, filepath, backend, repeat):
+    """Returns the fastest wall time over repeat runs and the number of findings extracted"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = func(filepath, backend)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark the XmlParser backends on a report")
+    arg_parser.add_argument('files', nargs='+')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    backends = [name for name in BACKENDS if name != 'lxml' or lxml_etree is not None]
+    if lxml_etree is None:
+        print("lxml is not installed, it is left out\n")
+
+    print(f"{'file':<30} {'MB':>8} {'mode':<10} {'backend':<8} {'seconds':>9} {'findings':>9}")
+    for filepath in args.files:
+        size = os.path.getsize(filepath) / (1024 * 1024)
+        for mode, func in (('tree', run_tree), ('streaming', run_streaming)):
+            for backend in backends:
+                if mode == 'tree' and not get_backend(backend).builds_trees:
+                    continue
+                elapsed, count = best_of(func, filepath, backend, args.repeat)
+                print(f"{os.path.basename(filepath):<30} {size:>8.1f} {mode:<10} {backend:<8} {elapsed:>9.3f} {count:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# Scaling benchmark of every XmlParser extraction path over synthetic reports from 1 MB to 1 GB
+# Usage: python benchmarks/bench_scaling.py [--sizes 1 10 100 1000] [--workdir DIR] [--json results.json]
+# Every measurement runs in a fresh interpreter so its peak RSS is its own.
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import BACKENDS, XmlParser, get_backend, lxml_etree
+from generate_report import generate
+
+
+def run_tree(filepath, backend):
+    parser = XmlParser(filepath, backend=backend)
+    parser.clean_document()
+    return sum(1 for _ in parser.iter_findings())
+
+
+def run_streaming(filepath, backend):
+    parser = XmlParser(filepath, streaming=True, backend=backend)
+    return sum(1 for _ in parser.stream_findings())
+
+
+def run_lazy(filepath, backend):
+    parser = XmlParser(filepath, backend=backend)
+    parser.clean_document()
+    return sum(1 for _ in parser.iter_findings(lazy=True))
+
+
+def run_prescan(filepath, backend):
+    """Only the High section, cut out of the raw bytes by the pre-scan before parsing"""
+    parser = XmlParser(filepath, backend=backend, severities=('High',))
+    if parser.streaming:
+        return sum(1 for _ in parser.stream_findings(('High',)))
+    parser.clean_document()
+    return sum(1 for _ in parser.iter_findings(('High',)))
+
+
+def run_stop_early(filepath, backend):
+    """Only the High section, streamed until it has closed"""
+    parser = XmlParser(filepath, streaming=True, backend=backend)
+    return sum(1 for _ in parser.stream_findings(('High',), stop_early=True))
+
+
+# Extraction paths measured for every installed backend
+PATHS = {'tree': run_tree, 'streaming': run_streaming, 'lazy': run_lazy, 'prescan': run_prescan,
+         'stop_early': run_stop_early}
+TREE_PATHS = {'tree', 'lazy'}  # Skipped for tree-less backends
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process in MB"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize / (1024 * 1024)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def count_paragraphs(filepath):
+    """Counts the w:p start tags of a plain XML report without parsing it"""
+    pattern = re.compile(rb'<w:p[ >]')
+    count = 0
+    tail = b''
+    with open(filepath, 'rb') as source:
+        for chunk in iter(lambda: source.read(1024 * 1024), b''):
+            data = tail + chunk
+            count += len(pattern.findall(data))
+            # A match is 5 bytes, so the last 4 can hold the start of a split tag but never a counted one
+            tail = data[-4:]
+    return count
+
+
+def measure(filepath, path, backend):
+    """Runs one extraction path in a child interpreter and returns its seconds, findings and peak RSS"""
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', filepath, path, backend],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def child(filepath, path, backend):
+    start = time.perf_counter()
+    findings = PATHS[path](filepath, backend)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'seconds': elapsed, 'findings': findings, 'peak_rss_mb': peak_rss_mb()}))
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == '--child':
+        return child(*sys.argv[2:])
+
+    arg_parser = argparse.ArgumentParser(description="Scaling benchmark of the XmlParser extraction paths")
+    arg_parser.add_argument('--sizes', type=float, nargs='+', default=[1, 10, 100, 1000], help="report sizes in MB")
+    arg_parser.add_argument('--workdir', default='bench_reports', help="where generated reports are kept and reused")
+    arg_parser.add_argument('--paths', nargs='+', choices=sorted(PATHS), default=sorted(PATHS))
+    arg_parser.add_argument('--json', help="also write the results to this file")
+    args = arg_parser.parse_args()
+
+    backends = [name for name in BACKENDS if name != 'lxml' or lxml_etree is not None]
+    os.makedirs(args.workdir, exist_ok=True)
+    results = []
+    print(f"{'MB':>8} {'paragraphs':>11} {'path':<11} {'backend':<8} {'seconds':>9} {'para/s':>11} {'peak MB':>9}")
+    for size in args.sizes:
+        filepath = os.path.join(args.workdir, f"report_{size:g}mb.xml")
+        if not os.path.isfile(filepath):
+            generate(filepath, size_mb=size)
+        paragraphs = count_paragraphs(filepath)
+        for path in args.paths:
+            for backend in backends:
+                if path in TREE_PATHS and not get_backend(backend).builds_trees:
+                    continue
+                result = measure(filepath, path, backend)
+                result.update(size_mb=size, paragraphs=paragraphs, path=path, backend=backend)
+                results.append(result)
+                print(f"{size:>8g} {paragraphs:>11} {path:<11} {backend:<8} {result['seconds']:>9.2f} "
+                      f"{paragraphs / result['seconds']:>11.0f} {result['peak_rss_mb']:>9.1f}", flush=True)
+
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(results, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
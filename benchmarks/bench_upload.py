@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# Benchmark of CanopyUploader against the local Canopy stub, next to uploading one finding per urllib request
+# Usage: python benchmarks/bench_upload.py [--findings 5000] [--latency 20] [--failure-rate 0.05]
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import ATTRIBUTE_NAMES, CanopyUploader, Finding, Severity
+from canopy_stub import start_in_thread
+from generate_report import WORDS
+
+
+def make_findings(count, seed=0):
+    rng = random.Random(seed)
+    sentence = lambda words: ' '.join(rng.choice(WORDS) for _ in range(words))
+    findings = []
+    for i in range(count):
+        finding = Finding(f"Finding {i}: {sentence(5)}", Severity.HIGH, f"report-{i // 100}.docx")
+        for attr in ATTRIBUTE_NAMES:
+            finding[attr] = sentence(80)
+        findings.append(finding)
+    return findings
+
+
+def upload_one_by_one(url, findings):
+    """The ad hoc way: one POST per finding, one connection per POST"""
+    for finding in findings:
+        body = json.dumps({'findings': [finding.to_record()]}).encode('utf-8')
+        request = urllib.request.Request(url, body, {'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            response.read()
+
+
+def upload_batched(url, findings, batch_size, concurrency):
+    uploader = CanopyUploader(url, batch_size=batch_size, concurrency=concurrency, backoff=0.01)
+    for finding in findings:
+        uploader.write(finding)
+    uploader.close()
+    return uploader
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark CanopyUploader against the local stub")
+    arg_parser.add_argument('--findings', type=int, default=5000)
+    arg_parser.add_argument('--latency', type=float, default=20.0, help="stub milliseconds per request")
+    arg_parser.add_argument('--failure-rate', type=float, default=0.0, help="share of stub requests that fail")
+    arg_parser.add_argument('--baseline', type=int, default=200,
+                            help="findings uploaded one by one for the baseline rate (default: %(default)s)")
+    args = arg_parser.parse_args()
+    findings = make_findings(args.findings)
+
+    print(f"{'mode':<28}{'findings/s':>12}{'requests':>10}{'connections':>13}{'retried':>9}{'imported':>10}")
+    if args.baseline:
+        stub, url, stop = start_in_thread(latency=args.latency / 1000)
+        started = time.perf_counter()
+        upload_one_by_one(url, findings[:args.baseline])
+        elapsed = time.perf_counter() - started
+        stop()
+        print(f"{'one by one':<28}{args.baseline / elapsed:>12.0f}{stub.stats['requests']:>10}"
+              f"{stub.stats['connections']:>13}{0:>9}{stub.stats['findings']:>10}")
+    for batch_size, concurrency in [(100, 1), (100, 4), (500, 4), (500, 16)]:
+        stub, url, stop = start_in_thread(latency=args.latency / 1000, failure_rate=args.failure_rate)
+        started = time.perf_counter()
+        uploader = upload_batched(url, findings, batch_size, concurrency)
+        elapsed = time.perf_counter() - started
+        stop()
+        mode = f"batch {batch_size}, concurrency {concurrency}"
+        print(f"{mode:<28}{len(findings) / elapsed:>12.0f}{stub.stats['requests']:>10}"
+              f"{stub.stats['connections']:>13}{uploader.retried:>9}{stub.stats['findings']:>10}")
+        if stub.stats['findings'] + uploader.failed != len(findings):
+            print(f"  {len(findings) - stub.stats['findings'] - uploader.failed} findings lost", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# Local stand-in for the Canopy findings endpoint, so CanopyUploader can be tested and benchmarked offline
+# Usage: python benchmarks/canopy_stub.py [--port 8080] [--latency 20] [--failure-rate 0.1]
+#        python main.py reports/ --canopy http://127.0.0.1:8080/api/findings
+# POST {"findings": [...]} to any path to import them, GET /stats for the counters.
+import argparse
+import asyncio
+import json
+import random
+import threading
+
+
+class CanopyStub:
+    """Keep-alive HTTP/1.1 server that counts the findings POSTed to it.
+
+    Every request waits latency seconds. failure_rate of them fail instead, half answering 503 with Retry-After
+    and half dropping the connection. Batches repeating an Idempotency-Key already imported are counted once.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.keys = set()
+        self.stats = {'connections': 0, 'requests': 0, 'batches': 0, 'findings': 0, 'duplicates': 0,
+                      'failures': 0, 'in_flight': 0, 'max_in_flight': 0}
+
+    async def handle(self, reader, writer):
+        self.stats['connections'] += 1
+        try:
+            while await self.handle_request(reader, writer):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, reader, writer):
+        """Answers one request, returns False once the connection is to be closed"""
+        request_line = await reader.readline()
+        if not request_line:
+            return False
+        method, path = request_line.decode('latin-1').split()[:2]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+        self.stats['requests'] += 1
+        if method == 'GET' and path == '/stats':
+            return await self.respond(writer, 200, self.stats)
+        if method != 'POST':
+            return await self.respond(writer, 405, {'error': 'POST findings'})
+        self.stats['in_flight'] += 1
+        self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self.stats['in_flight'])
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.stats['in_flight'] -= 1
+        if self.random.random() < self.failure_rate:
+            self.stats['failures'] += 1
+            if self.random.random() < 0.5:
+                return False  # Drop the connection without answering
+            return await self.respond(writer, 503, {'error': 'try again'}, {'Retry-After': '0'})
+        try:
+            findings = json.loads(body)['findings']
+        except (ValueError, KeyError, TypeError):
+            return await self.respond(writer, 400, {'error': 'expected {"findings": [...]}'})
+        key = headers.get('idempotency-key')
+        if key is not None and key in self.keys:
+            self.stats['duplicates'] += len(findings)
+        else:
+            self.keys.add(key)
+            self.stats['batches'] += 1
+            self.stats['findings'] += len(findings)
+        return await self.respond(writer, 200, {'imported': len(findings)})
+
+    async def respond(self, writer, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        lines = [f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}", 'Content-Type: application/json',
+                 f"Content-Length: {len(body)}"]
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+        return True
+
+
+def start_in_thread(host='127.0.0.1', port=0, **options):
+    """Runs a CanopyStub in a background thread, returns (stub, url, stop) where stop() shuts it down"""
+    stub = CanopyStub(**options)
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(stub.handle, host, port))
+    thread = threading.Thread(target=loop.run_forever, name='canopy-stub', daemon=True)
+    thread.start()
+    url = f"http://{host}:{server.sockets[0].getsockname()[1]}/api/findings"
+
+    def stop():
+        async def shutdown():
+            server.close()
+            await server.wait_closed()
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    return stub, url, stop
+
+
+async def serve(host, port, **options):
+    stub = CanopyStub(**options)
+    server = await asyncio.start_server(stub.handle, host, port)
+    print(f"Canopy stub listening on http://{host}:{port}/api/findings")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Local stub of the Canopy findings endpoint")
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8080)
+    arg_parser.add_argument('--latency', type=float, default=0.0, help="milliseconds per request (default: %(default)s)")
+    arg_parser.add_argument('--failure-rate', type=float, default=0.0,
+                            help="share of requests that fail (default: %(default)s)")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, latency=args.latency / 1000, failure_rate=args.failure_rate,
+                          seed=args.seed))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# Generate synthetic WordprocessingML reports shaped like ours, so XmlParser can be measured without customer data
+# Usage: python benchmarks/generate_report.py out.xml --size 100
+#        python benchmarks/generate_report.py out.docx --findings 50 --images 2 --image-size 200
+import argparse
+import base64
+import io
+import os
+import random
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import ATTRIBUTE_NAMES, SEVERITIES, W_NS
+
+SECTION_HEADINGS = {'High': "High Severity Findings", 'Medium': "Medium Severity Findings",
+                    'Low': "Low Severity Findings", 'Informational': "Informational Findings"}
+WORDS = ("request header response session token cookie server client input output validation missing "
+         "attacker user account password endpoint policy configuration access control injection script "
+         "certificate transport encryption storage bucket instance role permission log audit").split()
+CHAR_ATTRIBUTES = ("Severity", "Relevant CWEs")  # Written as Heading4Char runs, the rest as Heading4 paragraphs
+
+
+class ReportWriter:
+    """Writes one synthetic report to a text stream, paragraph by paragraph"""
+
+    def __init__(self, out, seed=0, words=40, body_paragraphs=2, images=0, image_size=0):
+        self.out = out
+        self.random = random.Random(seed)
+        self.words = words
+        self.body_paragraphs = body_paragraphs
+        self.images = images
+        self.image_size = image_size  # KB of base64 data per image
+        self.paragraphs = 0
+
+    def sentence(self, words=None):
+        return ' '.join(self.random.choice(WORDS) for _ in range(words or self.words))
+
+    def paragraph(self, text, pstyle=None, rstyle=None, extra=''):
+        ppr = f'<w:pPr><w:pStyle w:val="{pstyle}"/></w:pPr>' if pstyle else ''
+        rpr = f'<w:rPr><w:rStyle w:val="{rstyle}"/></w:rPr>' if rstyle else ''
+        self.out.write(f'<w:p w:rsidR="00A1B2C3">{ppr}<w:r>{rpr}<w:t xml:space="preserve">{text}</w:t></w:r>{extra}</w:p>')
+        self.paragraphs += 1
+
+    def hyperlink_runs(self):
+        """Field code runs of a hyperlink, including the literal HYPERLINK run the exports carry"""
+        url = f"https://example.com/{self.random.choice(WORDS)}"
+        return ('<w:r><w:fldChar w:fldCharType="begin"/></w:r>'
+                f'<w:r><w:instrText xml:space="preserve"> HYPERLINK "{url}" </w:instrText></w:r>'
+                '<w:r><w:t>HYPERLINK</w:t></w:r>'
+                '<w:r><w:fldChar w:fldCharType="separate"/></w:r>'
+                f'<w:r><w:t>{url}</w:t></w:r>'
+                '<w:r><w:fldChar w:fldCharType="end"/></w:r>')
+
+    def tracked_deletion(self):
+        return (f'<w:del w:id="1" w:author="Reviewer"><w:r><w:delText>{self.sentence(6)}</w:delText></w:r></w:del>'
+                f'<w:r w:rsidDel="00D4E5F6"><w:t>{self.sentence(3)}</w:t></w:r>')
+
+    def image(self):
+        data = base64.b64encode(self.random.randbytes(self.image_size * 768)).decode('ascii')
+        self.out.write(f'<w:p><w:r><w:pict><w:binData w:name="wordml://{self.paragraphs}.png">{data}</w:binData>'
+                       '<v:shape xmlns:v="urn:schemas-microsoft-com:vml"/></w:pict></w:r></w:p>')
+        self.paragraphs += 1
+
+    def finding(self, severity, number):
+        self.paragraph(f"{severity} finding {number}: {self.sentence(5)}", pstyle='Heading3')
+        for attr in ATTRIBUTE_NAMES:
+            if attr in CHAR_ATTRIBUTES:
+                value = severity if attr == "Severity" else f"CWE-{self.random.randint(16, 1000)}"
+                self.paragraph(f"{attr}:", rstyle='Heading4Char', extra=f'<w:r><w:t xml:space="preserve"> {value}</w:t></w:r>')
+                continue
+            self.paragraph(attr, pstyle='Heading4')
+            for i in range(self.body_paragraphs):
+                extra = self.hyperlink_runs() if i == 0 else self.tracked_deletion()
+                self.paragraph(self.sentence(), extra=extra)
+            if attr == "Vulnerability Details":
+                for _ in range(self.images):
+                    self.image()
+
+    def report(self, findings, appendix_paragraphs=0):
+        self.out.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<w:document xmlns:w="{W_NS}"><w:body>')
+        self.paragraph("Executive Summary", pstyle='Heading1')
+        self.paragraph(self.sentence())
+        for severity in SEVERITIES:
+            self.paragraph(SECTION_HEADINGS[severity], pstyle='Heading2')
+            for number in range(1, findings + 1):
+                self.finding(severity, number)
+        if appendix_paragraphs:
+            self.paragraph("Appendix", pstyle='Heading2')
+            for _ in range(appendix_paragraphs):
+                self.paragraph(self.sentence())
+        self.out.write('<w:sectPr/></w:body></w:document>')
+
+
+def finding_size(**options):
+    """Returns the approximate number of bytes one finding takes with the given writer options"""
+    out = io.StringIO()
+    ReportWriter(out, **options).finding('High', 1)
+    return len(out.getvalue().encode('utf-8'))
+
+
+def generate(path, findings=None, size_mb=None, appendix_ratio=0.0, docx=None, **options):
+    """Writes a report to path, either with findings per severity section or sized to roughly size_mb.
+
+    appendix_ratio is the share of the size spent in a trailing appendix section. Returns the paragraph count.
+    """
+    appendix_paragraphs = 0
+    if size_mb is not None:
+        target = size_mb * 1024 * 1024
+        appendix_bytes = target * appendix_ratio
+        findings = max(1, int((target - appendix_bytes) / (finding_size(**options) * len(SEVERITIES))))
+        appendix_paragraphs = int(appendix_bytes / (len(ReportWriter(io.StringIO(), **options).sentence()) + 60))
+    if docx is None:
+        docx = path.endswith('.docx')
+    if docx:
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as package:
+            with package.open('word/document.xml', 'w', force_zip64=True) as member:
+                with io.TextIOWrapper(member, encoding='utf-8') as out:
+                    writer = ReportWriter(out, **options)
+                    writer.report(findings, appendix_paragraphs)
+            package.writestr('[Content_Types].xml', '<?xml version="1.0"?><Types/>')
+    else:
+        with open(path, 'w', encoding='utf-8', buffering=1024 * 1024) as out:
+            writer = ReportWriter(out, **options)
+            writer.report(findings, appendix_paragraphs)
+    return writer.paragraphs
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Generate a synthetic report for benchmarks")
+    arg_parser.add_argument('path', help="output file, .docx paths are written as a Word package")
+    size = arg_parser.add_mutually_exclusive_group()
+    size.add_argument('--findings', type=int, default=10, help="findings per severity section (default: %(default)s)")
+    size.add_argument('--size', type=float, help="approximate size of the document in MB")
+    arg_parser.add_argument('--appendix-ratio', type=float, default=0.0,
+                            help="share of --size spent in a trailing appendix (default: %(default)s)")
+    arg_parser.add_argument('--words', type=int, default=40, help="words per body paragraph (default: %(default)s)")
+    arg_parser.add_argument('--body-paragraphs', type=int, default=2,
+                            help="paragraphs per Heading4 attribute body (default: %(default)s)")
+    arg_parser.add_argument('--images', type=int, default=0, help="w:binData images per finding (default: %(default)s)")
+    arg_parser.add_argument('--image-size', type=int, default=100, help="KB per image (default: %(default)s)")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    paragraphs = generate(args.path, findings=None if args.size else args.findings, size_mb=args.size,
+                          appendix_ratio=args.appendix_ratio, seed=args.seed, words=args.words,
+                          body_paragraphs=args.body_paragraphs, images=args.images, image_size=args.image_size)
+    print(f"{args.path}: {paragraphs} paragraphs, {os.path.getsize(args.path) / (1024 * 1024):.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,18 +10,1122 @@
 ## 6. Mitigation
 ## 7. Verification
 import xml.etree.ElementTree as ET
+from xml.parsers import expat
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from enum import Enum
+from itertools import accumulate
+import argparse
+import asyncio
+import base64
+import glob
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import math
+import mmap
 import os
+import random
+import re
+import sqlite3
+import ssl
+import sys
+import threading
+import time
+import urllib.parse
+import zipfile
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # lxml is optional, the ElementTree backend is used without it
+    lxml_etree = None
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W = '{' + W_NS + '}'
+# expat spells namespaced names without the opening brace
+EXPAT_W = W_NS + '}'
+EXPAT_STYLE_TAGS = (EXPAT_W + 'pStyle', EXPAT_W + 'rStyle', EXPAT_W + 'outlineLvl')
+EXPAT_CHUNK_SIZE = 64 * 1024  # bytes, small chunks keep expat's working set in the CPU cache
+
+STREAMING_THRESHOLD = 50 * 1024 * 1024  # bytes, larger inputs are extracted with iterparse
+REPORT_EXTENSIONS = ('.xml', '.docx')
+
+# Bump whenever a change alters extracted findings, so cached results of older versions are not reused
+EXTRACTOR_VERSION = 6
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024  # bytes
+JSONL_BUFFER_SIZE = 1024 * 1024  # bytes
+SQLITE_BATCH_SIZE = 10000  # findings per transaction
+FULLTEXT_BATCH_SIZE = 20000  # findings per full-text index segment
+FULLTEXT_FIELD_WEIGHTS = {'title': 2.0}  # Other fields, the attributes, weigh 1
+TOKEN_PATTERN = re.compile(r'\w+')
+QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Near-duplicate detection: MinHash signature length, LSH bands of MINHASH_PERMUTATIONS // LSH_BANDS values each
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+DEDUP_THRESHOLD = 0.8  # Estimated Jaccard similarity of word 3-gram sets
+# Canopy uploads: findings per request, requests in flight, batches waiting while extraction runs ahead
+CANOPY_BATCH_SIZE = 500
+CANOPY_CONCURRENCY = 4
+CANOPY_QUEUE_SIZE = 8
+CANOPY_RETRIES = 5
+CANOPY_BACKOFF = 0.5  # seconds, doubled after every failed attempt
+CANOPY_BACKOFF_MAX = 30.0  # seconds
+CANOPY_TIMEOUT = 60.0  # seconds per request
+CWE_PATTERN = re.compile(r'CWE-\d+')
+
+# The pre-scan finds severity sections by searching the raw bytes for Heading2 paragraph styles
+PRESCAN_MARKERS = re.compile(rb'<w:pStyle w:val="Heading2"\s*/>|</w:body>')
+PRESCAN_CHUNK_SIZE = 1024 * 1024  # bytes
+PRESCAN_MARGIN = 64 * 1024  # bytes
+BODY_START = re.compile(rb'<w:body[\s>]')
+STYLES_START = re.compile(rb'<w:styles[\s>]')
+ROOT_START = re.compile(rb'<[A-Za-z_][^>]*>')  # First start tag, skipping the XML declaration and comments
+
+# Elements carrying base64 payloads (Word 2003 XML images, flat OPC package parts) that no extractor reads
+BINARY_START_TAG = re.compile(rb'<(w:binData|pkg:binaryData)[\s/>]')
+BINARY_NAME = re.compile(rb'w:name="([^"]*)"')
+BINARY_TAG_MARGIN = len(b'<pkg:binaryData ')
+BINARY_FILTER_CHUNK_SIZE = 1024 * 1024  # bytes
+
+# Style of a single paragraph: its w:pStyle, the w:rStyle of its first styled run and its w:outlineLvl
+ParagraphStyle = namedtuple('ParagraphStyle', ['pstyle', 'rstyle', 'outline_level'])
+NO_STYLE = ParagraphStyle(None, None, None)
+
+
+
+class Severity(Enum):
+    """Severity sections of a report"""
+    HIGH = 'High'
+    MEDIUM = 'Medium'
+    LOW = 'Low'
+    INFORMATIONAL = 'Informational'
+
+
+SEVERITIES = tuple(severity.value for severity in Severity)
+
+# Attribute names are interned once and shared by every Finding, findings only hold the values
+ATTRIBUTE_NAMES = tuple(sys.intern(name) for name in
+                        ("Severity", "Relevant CWEs", "Vulnerability Details", "Impact", "Recommendation", "Verification"))
+
+
+class AttributeVocabulary:
+    """Attribute headings a report may use: canonical attribute names with their synonyms and translations.
+
+    Every phrase is compiled into one regex alternation, longest first, so a heading's text is matched in a
+    single scan that yields canonical names. Canonical names beyond ATTRIBUTE_NAMES are appended to names,
+    the attribute list of every Finding extracted with the vocabulary.
+    """
+
+    def __init__(self, synonyms=None, ignore_case=False):
+        self.synonyms = {name: list(phrases) for name, phrases in (synonyms or {}).items()}
+        self.ignore_case = ignore_case
+        self.names = ATTRIBUTE_NAMES + tuple(sys.intern(name) for name in self.synonyms if name not in ATTRIBUTE_NAMES)
+        self.canonical = {}  # Phrase, casefolded with ignore_case, to canonical name
+        for name in self.names:
+            for phrase in [name] + self.synonyms.get(name, []):
+                self.canonical.setdefault(self._fold(phrase), name)
+        phrases = sorted(self.canonical, key=len, reverse=True)
+        # With ignore_case, phrases and headings are both casefolded rather than matched with re.IGNORECASE, which
+        # folds some letters (e.g. a dotted capital I) differently, so every hit is a key of canonical
+        self.pattern = re.compile('|'.join(map(re.escape, phrases)))
+
+    @classmethod
+    def load(cls, path):
+        """Reads a JSON vocabulary file: {"canonical name": ["synonym", ...], ...}, optionally with "ignore_case"."""
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        ignore_case = bool(data.pop('ignore_case', False))
+        return cls(data, ignore_case)
+
+    def _fold(self, phrase):
+        return phrase.casefold() if self.ignore_case else phrase
+
+    def match(self, text):
+        """Returns the canonical names of the attributes a heading's text mentions, in the order they appear"""
+        names = []
+        for match in self.pattern.finditer(self._fold(text)):
+            name = self.canonical[match.group()]
+            if name not in names:
+                names.append(name)
+        return names
+
+    def config(self):
+        """Returns the JSON-ready description of the vocabulary, for cache keys"""
+        return [self.names, self.synonyms, self.ignore_case]
+
+
+DEFAULT_VOCABULARY = AttributeVocabulary()
+
+
+class LazyText:
+    """Attribute text that is only built, by calling function(*args), when the Finding holding it is read"""
+
+    __slots__ = ('function', 'args')
+
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+
+    def __call__(self):
+        return self.function(*self.args)
+
+
+class Finding:
+    """One extracted finding: title, Severity, source report and its attribute texts.
+
+    Attribute values live in a list aligned with a shared tuple of attribute names rather than in a dict per
+    finding, an attribute the report does not have is None. Findings are read like a mapping of attribute
+    name to text. A value can also be a LazyText, which is replaced by its text on first access.
+    """
+
+    __slots__ = ('title', 'severity', 'report', 'names', 'values', 'duplicate_of', 'change')
+
+    def __init__(self, title, severity, report=None, names=ATTRIBUTE_NAMES, values=None):
+        self.title = title
+        self.severity = severity
+        self.report = report
+        self.names = names
+        self.values = values if values is not None else [None] * len(names)
+        self.duplicate_of = None  # (report, title) of the finding this one nearly duplicates, see NearDuplicateFilter
+        self.change = None  # 'added', 'changed' or 'removed' in a delta, see extract_report_delta
+
+    def _position(self, name):
+        try:
+            return self.names.index(name)
+        except ValueError:
+            raise KeyError(name) from None
+
+    def _value(self, position):
+        value = self.values[position]
+        if isinstance(value, LazyText):
+            value = self.values[position] = value()
+        return value
+
+    def __getitem__(self, name):
+        value = self._value(self._position(name))
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name, value):
+        self.values[self._position(name)] = value
+
+    def __contains__(self, name):
+        return name in self.names and self.values[self.names.index(name)] is not None
+
+    def get(self, name, default=None):
+        if name not in self:
+            return default
+        return self[name]
+
+    def items(self):
+        """Returns the (name, text) pairs of the attributes the finding has, in vocabulary order"""
+        return [(name, self._value(i)) for i, name in enumerate(self.names) if self.values[i] is not None]
+
+    @property
+    def attributes(self):
+        return dict(self.items())
+
+    @property
+    def cwes(self):
+        return CWE_PATTERN.findall(self.get("Relevant CWEs", ''))
+
+    def to_record(self):
+        """Returns the JSON-ready record of the finding"""
+        record = {
+            'report': self.report,
+            'severity': self.severity.value,
+            'title': self.title,
+            'cwes': self.cwes,
+            'attributes': self.attributes,
+        }
+        if self.duplicate_of is not None:
+            record['duplicate_of'] = {'report': self.duplicate_of[0], 'title': self.duplicate_of[1]}
+        if self.change is not None:
+            record['change'] = self.change
+        return record
+
+    @classmethod
+    def from_record(cls, record, names=ATTRIBUTE_NAMES):
+        attributes = record['attributes']
+        finding = cls(record['title'], Severity(record['severity']), record.get('report'), names,
+                      [attributes.get(name) for name in names])
+        if record.get('duplicate_of'):
+            finding.duplicate_of = (record['duplicate_of']['report'], record['duplicate_of']['title'])
+        finding.change = record.get('change')
+        return finding
+
+    def __eq__(self, other):
+        if not isinstance(other, Finding):
+            return NotImplemented
+        return (self.title, self.severity, self.report, self.items()) == (other.title, other.severity, other.report, other.items())
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Finding({self.title!r}, {self.severity}, {len(self.items())} attributes)"
+
+
+# Heading class of the built-in heading style IDs, of the built-in style names and of outline levels
+HEADING_STYLE_IDS = {'Heading2': 'Heading2', 'Heading3': 'Heading3', 'Heading4': 'Heading4'}
+HEADING_STYLE_NAMES = {'heading 2': 'Heading2', 'heading 3': 'Heading3', 'heading 4': 'Heading4'}
+OUTLINE_CLASSES = {1: 'Heading2', 2: 'Heading3', 3: 'Heading4'}  # w:outlineLvl counts from 0 for Heading1
+
+
+class StyleResolver:
+    """Heading classes of a document's style IDs, resolved once from its style definitions.
+
+    A paragraph style is a heading when it is a built-in heading style or has its name or outline level, or is
+    basedOn such a style. A character style counts as Heading4Char when it is, links to or is based on one.
+    Classifying a paragraph is then two dict lookups.
+    """
+
+    def __init__(self, paragraph_classes=None, character_classes=None):
+        self.paragraph_classes = dict(HEADING_STYLE_IDS)
+        self.paragraph_classes.update(paragraph_classes or {})
+        self.character_classes = {'Heading4Char': 'Heading4Char'}
+        self.character_classes.update(character_classes or {})
+
+    @classmethod
+    def from_styles(cls, styles):
+        """Builds the resolver from a w:styles element"""
+        definitions = {}
+        for style in styles.iter(W + 'style'):
+            values = {}
+            for tag in ('name', 'basedOn', 'link', 'pPr/' + W + 'outlineLvl'):
+                elem = style.find(W + tag)
+                values[tag] = elem.get(W + 'val') if elem is not None else None
+            outline_level = values['pPr/' + W + 'outlineLvl']
+            definitions[style.get(W + 'styleId')] = (style.get(W + 'type'), (values['name'] or '').lower(),
+                                                    values['basedOn'], values['link'],
+                                                    int(outline_level) if outline_level else None)
+
+        def paragraph_class(style_id):
+            seen = set()
+            while style_id is not None and style_id not in seen:  # basedOn chains can loop in broken documents
+                seen.add(style_id)
+                if style_id in HEADING_STYLE_IDS:
+                    return HEADING_STYLE_IDS[style_id]
+                if style_id not in definitions:
+                    return None
+                _, name, based_on, _, outline_level = definitions[style_id]
+                if name in HEADING_STYLE_NAMES:
+                    return HEADING_STYLE_NAMES[name]
+                if outline_level is not None:
+                    return OUTLINE_CLASSES.get(outline_level)
+                style_id = based_on
+            return None
+
+        def is_heading4_char(style_id):
+            seen = set()
+            while style_id is not None and style_id not in seen:
+                seen.add(style_id)
+                if style_id == 'Heading4Char':
+                    return True
+                if style_id not in definitions:
+                    return False
+                _, _, based_on, link, _ = definitions[style_id]
+                if link is not None and paragraph_class(link) == 'Heading4':
+                    return True
+                style_id = based_on
+            return False
+
+        paragraph_classes = {}
+        character_classes = {}
+        for style_id, (style_type, *_) in definitions.items():
+            if style_type == 'character':
+                if is_heading4_char(style_id):
+                    character_classes[style_id] = 'Heading4Char'
+            elif paragraph_class(style_id) is not None:
+                paragraph_classes[style_id] = paragraph_class(style_id)
+        return cls(paragraph_classes, character_classes)
+
+    def paragraph_class(self, style):
+        """Returns 'Heading2', 'Heading3' or 'Heading4' from the paragraph style or outline level of a ParagraphStyle"""
+        heading_class = self.paragraph_classes.get(style.pstyle)
+        if heading_class is None and style.outline_level is not None:
+            return OUTLINE_CLASSES.get(style.outline_level)
+        return heading_class
+
+    def character_class(self, style):
+        return self.character_classes.get(style.rstyle)
+
+    def classify(self, style):
+        """Returns the heading class ('Heading2', 'Heading3', 'Heading4', 'Heading4Char') of a ParagraphStyle, or None"""
+        heading_class = self.paragraph_class(style)
+        if heading_class in ('Heading2', 'Heading3'):
+            return heading_class
+        return self.character_class(style) or heading_class
+
+    def markers(self, heading_classes):
+        """Returns a byte pattern for the style references of paragraphs in the given heading classes, for scan_sections"""
+        alternatives = []
+        for tag, table in ((b'pStyle', self.paragraph_classes), (b'rStyle', self.character_classes)):
+            style_ids = sorted(re.escape(style_id.encode('utf-8')) for style_id, heading_class in table.items()
+                               if heading_class in heading_classes)
+            if style_ids:
+                alternatives.append(b'<w:' + tag + b' w:val="(?:' + b'|'.join(style_ids) + rb')"\s*/>')
+        levels = [str(level).encode() for level, heading_class in OUTLINE_CLASSES.items()
+                  if heading_class in heading_classes]
+        if levels:
+            alternatives.append(rb'<w:outlineLvl w:val="(?:' + b'|'.join(levels) + rb')"\s*/>')
+        return re.compile(b'|'.join(alternatives + [b'</w:body>']))
+
+
+DEFAULT_STYLES = StyleResolver()
+
+
+def is_cleanup_target(elem, hyperlinks=True, deletions=True):
+    """Returns True for elements the cleanup drops: HYPERLINK field runs, w:del and anything marked w:rsidDel"""
+    if deletions and (elem.tag == W + 'del' or elem.get(W + 'rsidDel') is not None):
+        return True
+    if hyperlinks and elem.tag == W + 'r':
+        text_elem = elem.find(W + 't')
+        return text_elem is not None and text_elem.text == "HYPERLINK"
+    return False
+
+
+class ElementTreeBackend:
+    """Parser backend on the standard library's xml.etree.ElementTree"""
+
+    name = 'etree'
+    ParseError = ET.ParseError
+    builds_trees = True
+
+    def parse(self, source):
+        return ET.parse(source)
+
+    def iterparse(self, source, events):
+        return ET.iterparse(source, events=events)
+
+    def paragraphs(self, root):
+        """Returns every w:p under root in document order"""
+        return list(root.iter(W + 'p'))
+
+    def texts(self, elem):
+        """Returns the .text of every w:t under elem in document order, None for empty ones"""
+        return [t.text for t in elem.iter(W + 't')]
+
+    def clean(self, root, hyperlinks, deletions):
+        """Removes every is_cleanup_target element under root in one walk"""
+        stack = [root]
+        while stack:
+            parent = stack.pop()
+            for child in list(parent):
+                if is_cleanup_target(child, hyperlinks, deletions):
+                    parent.remove(child)  # Removed subtrees are not walked
+                else:
+                    stack.append(child)
+
+    def paragraph_styles(self, root, paragraphs):
+        """Returns the ParagraphStyle of every paragraph in the list"""
+        return [self.paragraph_style(p) for p in paragraphs]
+
+    def paragraph_style(self, p):
+        """Reads the pStyle, first rStyle and outline level of a paragraph in a single walk of its subtree"""
+        pstyle = rstyle = outline_level = None
+        for elem in p.iter():
+            tag = elem.tag
+            if tag == W + 'pStyle':
+                pstyle = elem.get(W + 'val')
+            elif tag == W + 'outlineLvl':
+                outline_level = int(elem.get(W + 'val'))
+            elif tag == W + 'rStyle':
+                # w:pPr always comes first, so nothing is left to find after the first run style
+                rstyle = elem.get(W + 'val')
+                break
+        if pstyle is None and rstyle is None and outline_level is None:
+            return NO_STYLE
+        return ParagraphStyle(pstyle, rstyle, outline_level)
+
+
+class LxmlBackend:
+    """Parser backend on lxml, with the paragraph and style queries compiled once into XPath objects"""
+
+    name = 'lxml'
+    builds_trees = True
+    STYLE_TAGS = (W + 'pStyle', W + 'rStyle', W + 'outlineLvl')
+    PARSER_OPTIONS = {'huge_tree': True, 'resolve_entities': False, 'no_network': True}
+
+    def __init__(self):
+        self.ParseError = lxml_etree.ParseError
+        namespaces = {'w': W_NS}
+        # huge_tree lifts libxml2's limits on text node size, base64 images easily exceed them. It also lifts the
+        # entity amplification limits, so it is only safe with entities left unresolved: reports are untrusted input
+        self._parser = lxml_etree.XMLParser(**self.PARSER_OPTIONS)
+        self._paragraphs = lxml_etree.XPath('//w:p', namespaces=namespaces)
+        # Separate queries rather than one union, lxml sorts union results into document order which costs more
+        self._deletions = [lxml_etree.XPath('//w:del', namespaces=namespaces),
+                           lxml_etree.XPath('//*[@w:rsidDel]', namespaces=namespaces)]
+        self._hyperlink_runs = lxml_etree.XPath('//w:r[w:t[1] = "HYPERLINK"]', namespaces=namespaces)
+
+    def parse(self, source):
+        return lxml_etree.parse(source, self._parser)
+
+    def iterparse(self, source, events):
+        return lxml_etree.iterparse(source, events=events, **self.PARSER_OPTIONS)
+
+    def paragraphs(self, root):
+        """Returns every w:p under root in document order"""
+        return self._paragraphs(root)
+
+    def texts(self, elem):
+        """Returns the .text of every w:t under elem in document order, None for empty ones"""
+        # A tag filtered iter() runs in C and beats an XPath call per paragraph
+        return [t.text for t in elem.iter(W + 't')]
+
+    def clean(self, root, hyperlinks, deletions):
+        """Removes every is_cleanup_target element under root, found with the precompiled cleanup queries"""
+        queries = (self._deletions if deletions else []) + ([self._hyperlink_runs] if hyperlinks else [])
+        for query in queries:
+            for elem in query(root):
+                parent = elem.getparent()
+                if parent is not None:
+                    parent.remove(elem)
+
+    def paragraph_styles(self, root, paragraphs):
+        """Returns the ParagraphStyle of every paragraph in the list from one filtered walk of the whole tree.
+
+        Styles are read like ElementTreeBackend.paragraph_style does: a style element counts for every paragraph
+        around it, so the styles of a text box paragraph also count for the paragraph holding the text box.
+        """
+        positions = {p: i for i, p in enumerate(paragraphs)}
+        pstyles = [None] * len(paragraphs)
+        rstyles = [None] * len(paragraphs)
+        outline_levels = [None] * len(paragraphs)
+        for elem in root.iter(*self.STYLE_TAGS):
+            tag = elem.tag
+            p = elem.getparent()
+            while p is not None:
+                i = positions.get(p) if p.tag == W + 'p' else None
+                p = p.getparent()
+                if i is None or rstyles[i] is not None:
+                    continue  # Nothing is read after a paragraph's first run style
+                if tag == W + 'pStyle':
+                    pstyles[i] = elem.get(W + 'val')
+                elif tag == W + 'rStyle':
+                    rstyles[i] = elem.get(W + 'val')
+                else:
+                    outline_levels[i] = int(elem.get(W + 'val'))
+        return [ParagraphStyle(*style) if style != (None, None, None) else NO_STYLE
+                for style in zip(pstyles, rstyles, outline_levels)]
+
+    def paragraph_style(self, p):
+        """Reads the pStyle, first rStyle and outline level of a paragraph like ElementTreeBackend, walking only
+        the style elements of its subtree"""
+        pstyle = rstyle = outline_level = None
+        for elem in p.iter(*self.STYLE_TAGS):
+            tag = elem.tag
+            if tag == W + 'pStyle':
+                pstyle = elem.get(W + 'val')
+            elif tag == W + 'outlineLvl':
+                outline_level = int(elem.get(W + 'val'))
+            else:
+                rstyle = elem.get(W + 'val')
+                break
+        if pstyle is None and rstyle is None and outline_level is None:
+            return NO_STYLE
+        return ParagraphStyle(pstyle, rstyle, outline_level)
+
+
+class ExpatParagraph:
+    """A paragraph as the expat backend hands it out: its ParagraphStyle and the texts of its w:t elements"""
+
+    __slots__ = ('style', 'texts')
+
+    def __init__(self, style, texts):
+        self.style = style
+        self.texts = texts
+
+
+class ExpatParagraphReader:
+    """Event state machine on xml.parsers.expat that turns a document stream into ExpatParagraphs, building no tree.
+
+    Only the open paragraph is kept, as a list of (tag, value) items: style values and w:t texts in document order.
+    Runs buffer their items until they end, so that a HYPERLINK run can be dropped as a whole; deleted elements are
+    skipped from their start tag on. The result matches clean_document followed by the tree paths.
+    """
+
+    def __init__(self, clean=True):
+        self.clean = clean
+        self.paragraphs = []  # Completed paragraphs not handed out yet
+        self.depth = 0
+        self.p_depth = 0  # w:p nesting, text boxes can carry paragraphs of their own
+        self.drop_depth = None  # Depth of the deleted element currently being skipped
+        self.frames = []  # Items of the open paragraph, then of each open run inside it
+        self.runs = []  # [depth, first w:t seen, its text] of each open run
+        self.text = None  # Character data of the open w:t
+        self.parser = expat.ParserCreate(namespace_separator='}')
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+
+    def start(self, tag, attrs):
+        self.depth += 1
+        if self.drop_depth is not None:
+            return
+        if self.clean and (tag == EXPAT_W + 'del' or EXPAT_W + 'rsidDel' in attrs):
+            self.drop_depth = self.depth
+            return
+        if tag == EXPAT_W + 'p':
+            self.p_depth += 1
+            if self.p_depth == 1:
+                self.frames.append([])
+        elif not self.frames:
+            return  # Nothing outside paragraphs is kept
+        elif tag == EXPAT_W + 'r':
+            self.frames.append([])
+            self.runs.append([self.depth, False, None])
+        elif tag == EXPAT_W + 't':
+            self.text = []
+            # Character data is only delivered inside w:t
+            self.parser.CharacterDataHandler = self.text.append
+        elif tag in EXPAT_STYLE_TAGS:
+            self.frames[-1].append((tag, attrs.get(EXPAT_W + 'val')))
+
+    def end(self, tag):
+        depth = self.depth
+        self.depth -= 1
+        if self.drop_depth is not None:
+            if depth == self.drop_depth:
+                self.drop_depth = None
+            return
+        if not self.frames:
+            return
+        if tag == EXPAT_W + 't':
+            text = ''.join(self.text) or None
+            self.parser.CharacterDataHandler = None
+            self.text = None
+            self.frames[-1].append((tag, text))
+            run = self.runs[-1] if self.runs else None
+            if run is not None and run[0] == depth - 1 and not run[1]:
+                run[1:] = True, text
+        elif tag == EXPAT_W + 'r' and self.runs and self.runs[-1][0] == depth:
+            _, _, first_text = self.runs.pop()
+            items = self.frames.pop()
+            if not (self.clean and first_text == "HYPERLINK"):
+                self.frames[-1].extend(items)
+        elif tag == EXPAT_W + 'p':
+            self.p_depth -= 1
+            if self.p_depth == 0:
+                self.paragraphs.append(self.paragraph(self.frames.pop()))
+
+    @staticmethod
+    def paragraph(items):
+        """Builds the ExpatParagraph of a paragraph's items, reading its style like ElementTreeBackend does"""
+        pstyle = rstyle = outline_level = None
+        texts = []
+        styled = False  # Set at the first run style, after which styles are no longer read
+        for tag, value in items:
+            if tag == EXPAT_W + 't':
+                texts.append(value)
+            elif styled:
+                continue
+            elif tag == EXPAT_W + 'pStyle':
+                pstyle = value
+            elif tag == EXPAT_W + 'outlineLvl':
+                outline_level = int(value)
+            else:
+                rstyle = value
+                styled = True
+        if pstyle is None and rstyle is None and outline_level is None:
+            return ExpatParagraph(NO_STYLE, texts)
+        return ExpatParagraph(ParagraphStyle(pstyle, rstyle, outline_level), texts)
+
+    def read(self, source, chunk_size=EXPAT_CHUNK_SIZE):
+        """Feeds the stream to expat chunk by chunk, yielding the paragraphs completed by each chunk"""
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            self.parser.Parse(chunk, False)
+            paragraphs, self.paragraphs = self.paragraphs, []
+            yield from paragraphs
+        self.parser.Parse(b'', True)
+        yield from self.paragraphs
+
+
+class ExpatBackend:
+    """Tree-less parser backend on xml.parsers.expat, for exports too large even for iterparse.
+
+    It only streams: XmlParser always runs in streaming mode with it, and paragraphs are ExpatParagraphs.
+    """
+
+    name = 'expat'
+    ParseError = expat.ExpatError
+    builds_trees = False
+
+    def iter_paragraphs(self, source, clean=True):
+        return ExpatParagraphReader(clean).read(source)
+
+    def texts(self, p):
+        return p.texts
+
+    def paragraph_style(self, p):
+        return p.style
+
+
+ELEMENT_TREE = ElementTreeBackend()  # Reads the paragraphs pre-scans cut out of the raw bytes, whatever the backend
+BACKENDS = {'etree': ElementTreeBackend, 'lxml': LxmlBackend, 'expat': ExpatBackend}
+
+
+def get_backend(name=None):
+    """Returns a parser backend by name, or lxml when it is installed and ElementTree otherwise if name is None"""
+    if name is None:
+        name = 'lxml' if lxml_etree is not None else 'etree'
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown parser backend: {name}")
+    if name == 'lxml' and lxml_etree is None:
+        raise ValueError("The lxml backend needs lxml installed")
+    return BACKENDS[name]()
+
+
+def tag_depth_change(data):
+    """Returns by how much the element depth changes over a run of raw XML bytes that starts at a '<'.
+
+    Tags are counted, not parsed. Comments, processing instructions or a literal '/>' in text throw the count
+    off, which makes the headings after them look nested, so the document is parsed whole: slower, not wrong.
+    """
+    return data.count(b'<') - 2 * data.count(b'</') - data.count(b'/>')
+
+
+def scan_sections(source, chunk_size=PRESCAN_CHUNK_SIZE, markers=PRESCAN_MARKERS):
+    """Finds the Heading2 paragraphs of a raw WordprocessingML stream by searching its bytes, without parsing it.
+
+    Returns (root_tag, headings, body_end): the bytes of the w:document start tag, an (offset, paragraph bytes,
+    nested) triple for every Heading2 paragraph and the offset of </w:body>. nested is True for paragraphs that
+    are not direct children of w:body, e.g. in a table or a content control, where cutting the body at them
+    would not give well-formed pieces. Returns None when the layout is not recognised. Other markers find other
+    paragraphs, a paragraph holding several of them is listed once per marker. Only markers inside w:body count.
+    """
+    root_tag = None
+    headings = []
+    body_start = None
+    body_end = None
+    depth = 0  # Element depth at offset counted, w:body itself being depth 1
+    counted = None
+    buffer = b''
+    base = 0  # Offset of buffer[0] in the stream
+    scanned = 0  # Offset up to which markers have been handled
+    while True:
+        chunk = source.read(chunk_size)
+        buffer += chunk
+        # Leave PRESCAN_MARGIN bytes after a marker in the buffer, enough to hold the rest of its paragraph
+        limit = len(buffer) if not chunk else len(buffer) - PRESCAN_MARGIN
+        if root_tag is None:
+            start = buffer.find(b'<w:document')
+            end = buffer.find(b'>', start) if start >= 0 else -1
+            if end >= 0:
+                root_tag = buffer[start:end + 1]
+        if body_start is None:
+            match = BODY_START.search(buffer)
+            if match is not None:
+                body_start = counted = base + match.start()
+        for match in markers.finditer(buffer, scanned - base):
+            if match.start() >= limit:
+                break
+            if match.group() == b'</w:body>':
+                if body_end is None:
+                    body_end = base + match.start()
+                continue
+            if body_start is None or base + match.start() < body_start or body_end is not None:
+                continue  # Style definitions and other parts of a flat package can carry the same markup
+            # Step back over <w:pPr>, <w:pStyle ... to the paragraph's start tag, one margin at most
+            lower = max(match.start() - PRESCAN_MARGIN, 0)
+            start = buffer.rfind(b'<w:p', lower, match.start())
+            while start >= 0 and buffer[start + 4:start + 5] not in (b' ', b'>'):
+                start = buffer.rfind(b'<w:p', lower, start)
+            end = buffer.find(b'</w:p>', match.end())
+            if start < 0 or end < 0:
+                return None
+            if base + start > counted:
+                depth += tag_depth_change(buffer[counted - base:start])
+                counted = base + start
+            headings.append((base + start, buffer[start:end + len(b'</w:p>')], depth != 1))
+        if not chunk:
+            break
+        scanned = base + max(limit, 0)
+        # Keep one margin of already scanned bytes, a heading's start tag sits just before its pStyle
+        keep_from = max(scanned - base - PRESCAN_MARGIN, 0)
+        if counted is not None and body_end is None:
+            # Count the tags of the bytes about to be dropped, up to a '<' so that no tag is cut in two
+            cut = buffer.rfind(b'<', counted - base, keep_from)
+            if cut > counted - base:
+                depth += tag_depth_change(buffer[counted - base:cut])
+                counted = base + cut
+            keep_from = min(keep_from, counted - base)
+        buffer = buffer[keep_from:]
+        base += keep_from
+    if root_tag is None or root_tag.endswith(b'/>') or not headings or body_end is None:
+        return None
+    return root_tag, headings, body_end
+
+
+def scan_styles(source, chunk_size=PRESCAN_CHUNK_SIZE):
+    """Finds the w:styles element of a flat WordprocessingML stream, e.g. the styles part of a flat OPC package.
+
+    Returns its bytes wrapped in a copy of the document's root start tag, which declares the namespaces it may
+    use, or None when the document has no style definitions. A plain document is only read up to its w:body,
+    the parts of a pkg:package are searched through to the end.
+    """
+    root_tag = None
+    buffer = b''
+    start = None
+    for chunk in iter(lambda: source.read(chunk_size), b''):
+        buffer += chunk
+        if root_tag is None:
+            match = ROOT_START.search(buffer)
+            if match is None:
+                continue
+            root_tag = match.group()
+            root_name = root_tag[1:].split(None, 1)[0].rstrip(b'/>')
+        if start is None:
+            match = STYLES_START.search(buffer)
+            if root_name != b'pkg:package':
+                # A document's own w:styles come before its body, only package parts may follow the body
+                body = BODY_START.search(buffer)
+                if body is not None and (match is None or body.start() < match.start()):
+                    return None
+            if match is None:
+                buffer = buffer[-len(b'<w:styles '):]
+                continue
+            buffer = buffer[match.start():]
+            start = 0
+        end = buffer.find(b'</w:styles>')
+        if end >= 0:
+            if root_tag.endswith(b'/>'):
+                return None
+            return root_tag + buffer[:end + len(b'</w:styles>')] + b'</' + root_name + b'>'
+    return None
+
+
+class RangeReader(io.RawIOBase):
+    """Read-only stream made of pieces: literal bytes and (start, stop) byte ranges of another stream"""
+
+    def __init__(self, source, pieces):
+        self.source = source
+        self.pieces = list(reversed(pieces))
+        self._data = b''
+        self._remaining = 0  # Bytes left in the current range of source
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while True:
+            if self._data:
+                n = min(len(b), len(self._data))
+                b[:n] = self._data[:n]
+                self._data = self._data[n:]
+                return n
+            if self._remaining:
+                data = self.source.read(min(len(b), self._remaining))
+                if not data:
+                    raise ValueError("Document ended before the end of a scanned section")
+                self._remaining -= len(data)
+                b[:len(data)] = data
+                return len(data)
+            if not self.pieces:
+                return 0
+            piece = self.pieces.pop()
+            if isinstance(piece, bytes):
+                self._data = piece
+            else:
+                start, stop = piece
+                self._seek(start)
+                self._remaining = stop - start
+
+    def _seek(self, offset):
+        if self.source.seekable():
+            self.source.seek(offset)
+            return
+        skip = offset - self.source.tell()
+        while skip > 0:
+            skipped = len(self.source.read(min(skip, PRESCAN_CHUNK_SIZE)))
+            if not skipped:
+                break
+            skip -= skipped
+
+
+class BinaryFilterReader(io.RawIOBase):
+    """Stream filter that drops the base64 text of w:binData / pkg:binaryData elements before the parser sees it.
+
+    The elements themselves stay, empty. With attachments_dir, their payloads are base64 decoded on the fly
+    into files there instead of being thrown away.
+    """
+
+    def __init__(self, source, attachments_dir=None):
+        self.source = source
+        self.attachments_dir = attachments_dir
+        self._pending = b''  # Input that has not been filtered yet
+        self._out = b''  # Filtered output that has not been read yet
+        self._eof = False
+        self._end_tag = None  # End tag of the binary element whose text is being dropped
+        self._attachment = None
+        self._leftover = b''  # base64 characters short of a full 4 character group
+        self._count = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._out:
+            if self._eof and not self._pending:
+                return 0
+            self._step()
+        n = min(len(b), len(self._out))
+        b[:n] = self._out[:n]
+        self._out = self._out[n:]
+        return n
+
+    def _step(self):
+        if not self._eof:
+            chunk = self.source.read(BINARY_FILTER_CHUNK_SIZE)
+            self._eof = not chunk
+            self._pending += chunk
+        data = self._pending
+        if self._end_tag is not None:
+            end = data.find(self._end_tag)
+            if end < 0:
+                # Hold back what could be the start of the end tag
+                split = len(data) if self._eof else max(len(data) - len(self._end_tag) + 1, 0)
+                self._write_attachment(data[:split])
+                self._pending = data[split:]
+                return
+            self._write_attachment(data[:end])
+            self._close_attachment()
+            self._end_tag = None
+            self._pending = data[end:]
+            return
+        match = BINARY_START_TAG.search(data)
+        close = data.find(b'>', match.end() - 1) if match else -1
+        if match is None or close < 0:
+            # Hold back what could be the start of a binary element's start tag
+            split = len(data) if self._eof else (match.start() if match else max(len(data) - BINARY_TAG_MARGIN, 0))
+            self._out += data[:split]
+            self._pending = data[split:]
+            return
+        self._out += data[:close + 1]
+        self._pending = data[close + 1:]
+        if data[close - 1:close] != b'/':
+            self._end_tag = b'</' + match.group(1) + b'>'
+            self._open_attachment(data[match.start():close + 1])
+
+    def _open_attachment(self, start_tag):
+        if self.attachments_dir is None:
+            return
+        self._count += 1
+        name = BINARY_NAME.search(start_tag)
+        # wordml://03000001.png style names keep their file name, anything else is numbered
+        filename = os.path.basename(name.group(1).decode('utf-8', 'replace')) if name else ''
+        filename = f"{self._count:04d}-{filename or 'attachment.bin'}"
+        os.makedirs(self.attachments_dir, exist_ok=True)
+        self._attachment = open(os.path.join(self.attachments_dir, filename), 'wb')
+        self._leftover = b''
+
+    def _write_attachment(self, data):
+        if self._attachment is None:
+            return
+        data = self._leftover + data.translate(None, b' \t\r\n')
+        usable = len(data) // 4 * 4
+        self._attachment.write(base64.b64decode(data[:usable]))
+        self._leftover = data[usable:]
+
+    def _close_attachment(self):
+        if self._attachment is None:
+            return
+        self._attachment.close()
+        self._attachment = None
+
+    def close(self):
+        self._close_attachment()
+        super().close()
+
+
+class ParagraphIndex:
+    """Paragraph list of a parsed document with each paragraph's heading style and the position of the next heading."""
+
+    def __init__(self, parser, root):
+        self.paragraphs = parser.backend.paragraphs(root)
+        self.positions = {p: i for i, p in enumerate(self.paragraphs)}
+        self.style_info = parser.backend.paragraph_styles(root, self.paragraphs)
+        self.styles = [parser.style_resolver.classify(style) for style in self.style_info]
+        # next_heading[i] is the index of the first heading after paragraph i (len(paragraphs) if there is none),
+        # so the body of a Heading4 at i is simply paragraphs[i + 1:next_heading[i]]
+        self.next_heading = [len(self.paragraphs)] * len(self.paragraphs)
+        for i in range(len(self.paragraphs) - 2, -1, -1):
+            if self.styles[i + 1] is not None:
+                self.next_heading[i] = i + 1
+            else:
+                self.next_heading[i] = self.next_heading[i + 1]
+
+    def __len__(self):
+        return len(self.paragraphs)
+
+    def body_range(self, index):
+        """Returns the (start, stop) paragraph range that follows the heading at index up to the next heading."""
+        return index + 1, self.next_heading[index]
+
 
 class XmlParser:
 
-    def __init__(self, filepath):
+    # Heading2 text that opens each severity section
+    SEVERITY_SECTIONS = [("High Severity Findings", Severity.HIGH), ("Medium Severity Findings", Severity.MEDIUM),
+                         ("Low Severity Findings", Severity.LOW), ("Informational", Severity.INFORMATIONAL)]
+
+    def __init__(self, filepath, streaming=False, backend=None, severities=None, skip_binary=False,
+                 attachments_dir=None, pieces=None, style_resolver=None, vocabulary=None):
         if not os.path.isfile(filepath):
             raise ValueError("File not found")
-        self.tree = ET.parse(filepath)
-        self.root = self.tree.getroot()
-        self.namespace = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
+        self.filepath = filepath
+        self.backend = get_backend(backend)
+        self.vocabulary = vocabulary or DEFAULT_VOCABULARY
+        # Tree-less backends always stream
+        self.streaming = streaming or not self.backend.builds_trees
+        # Embedded images are dropped from the input before parsing, or decoded into attachments_dir
+        self.skip_binary = skip_binary or attachments_dir is not None
+        self.attachments_dir = attachments_dir
+        self.namespace = {'w': W_NS}
+        # .docx packages are read in place, their parts are streamed out of the zip
+        self.is_docx = zipfile.is_zipfile(filepath)
+        self._style_resolver = style_resolver  # Read from the document on first use when not given
+        # With severities, only the byte ranges of those Heading2 sections are handed to the parser. Callers that
+        # know where their sections are pass the pieces themselves
+        self.section_pieces = pieces
+        if severities is not None and pieces is None:
+            self.section_pieces = self.plan_sections(severities)
+        self.tree = None
+        self.root = None
+        if not self.streaming:
+            # Streaming parsers never hold the whole tree, see iter_paragraphs
+            try:
+                with self.open_document() as source:
+                    self.tree = self.backend.parse(source)
+            except self.backend.ParseError:
+                if self.section_pieces is None:
+                    raise
+                # The sections did not cut cleanly along the document structure, parse all of it after all
+                self.section_pieces = None
+                with self.open_document() as source:
+                    self.tree = self.backend.parse(source)
+            self.root = self.tree.getroot()
         self.findings_dict = {} # Initialize dictionary
-        self.i = 1
+        self._paragraph_index = None
+
+    def plan_sections(self, severities):
+        """Pre-scans the raw document for the Heading2 sections of the given severities.
+
+        Returns the pieces of a synthetic document holding only those sections (see RangeReader), or None if
+        the scan does not recognise the document, in which case all of it is parsed.
+        """
+        severities = {Severity(severity) for severity in severities}
+        with self._open_raw_document() as source:
+            scan = scan_sections(source, markers=self.style_resolver.markers(('Heading2',)))
+        if scan is None:
+            return None
+        root_tag, candidates, body_end = scan
+        if any(nested for _, _, nested in candidates):
+            return None  # A section cut there would not parse, e.g. a heading inside a content control
+        headings = []
+        for offset, heading, _ in candidates:
+            if headings and headings[-1][0] == offset:
+                continue  # A paragraph holding several markers
+            try:
+                root = ET.fromstring(root_tag + heading + b'</w:document>')
+            except ET.ParseError:
+                return None
+            # The heading is an ElementTree element whatever the backend, read it directly
+            ELEMENT_TREE.clean(root, True, True)
+            if len(root) == 0:
+                continue  # A deleted heading paragraph, the cleanup drops it and its section runs on
+            p = root[0]
+            if self.style_resolver.classify(ELEMENT_TREE.paragraph_style(p)) == 'Heading2':
+                headings.append((offset, ''.join(t.text or '' for t in p.iter(W + 't'))))
+        if not headings:
+            return None
+        pieces = [root_tag + b'<w:body>']
+        for i, (offset, heading_text) in enumerate(headings):
+            if self.section_severity(heading_text) in severities:
+                stop = headings[i + 1][0] if i + 1 < len(headings) else body_end
+                pieces.append((offset, stop))
+        pieces.append(b'</w:body></w:document>')
+        return pieces
+
+    @contextmanager
+    def open_document(self):
+        """Opens the WordprocessingML document as a binary stream, word/document.xml when the input is a .docx.
+
+        When the parser was asked for some severities only, the stream holds just their sections. With
+        skip_binary, embedded binary payloads are filtered out of it.
+        """
+        with self._open_raw_document() as source:
+            stream = source
+            if self.section_pieces is not None:
+                stream = RangeReader(stream, self.section_pieces)
+            if self.skip_binary:
+                stream = BinaryFilterReader(stream, self.attachments_dir)
+            if stream is source:
+                yield source
+                return
+            with io.BufferedReader(stream, PRESCAN_CHUNK_SIZE) as buffered:
+                yield buffered
+
+    @contextmanager
+    def _open_raw_document(self):
+        if not self.is_docx:
+            with open(self.filepath, 'rb') as source:
+                yield source
+            return
+        with self.open_part('document.xml') as source:
+            if source is None:
+                raise ValueError("word/document.xml not found in the docx file")
+            yield source
+
+    @contextmanager
+    def open_part(self, name):
+        """Streams word/<name> (e.g. styles.xml, numbering.xml) straight out of a .docx, yields None if there is no such part"""
+        if not self.is_docx:
+            yield None
+            return
+        with zipfile.ZipFile(self.filepath) as package:
+            try:
+                info = package.getinfo('word/' + name)
+            except KeyError:
+                yield None
+                return
+            with package.open(info) as source:
+                yield source
+
+    @property
+    def style_resolver(self):
+        """StyleResolver of the document's own style definitions, read on first use"""
+        if self._style_resolver is None:
+            self._style_resolver = self.read_styles()
+        return self._style_resolver
+
+    def read_styles(self):
+        """Reads word/styles.xml of a .docx, or the w:styles element of a flat document, into a StyleResolver"""
+        try:
+            if self.is_docx:
+                with self.open_part('styles.xml') as source:
+                    styles = ET.parse(source).getroot() if source is not None else None
+            else:
+                with self._open_raw_document() as source:
+                    data = scan_styles(source)
+                styles = ET.fromstring(data) if data is not None else None
+        except ET.ParseError:
+            styles = None  # Unreadable style definitions leave the built-in heading styles
+        return StyleResolver.from_styles(styles) if styles is not None else DEFAULT_STYLES
+
+    @property
+    def paragraph_index(self):
+        """ParagraphIndex of the document, built on first use and rebuilt after the tree has been cleaned up."""
+        if self._paragraph_index is None:
+            self._paragraph_index = ParagraphIndex(self, self.root)
+        return self._paragraph_index
 
     def _print_elements(self, element, indent=0):
         """Recursively print nested XML elements."""
@@ -37,52 +1141,43 @@ class XmlParser:
         else:
             print("w:body tag not found in the XML")
     
+    def clean_document(self, hyperlinks=True, deletions=True):
+        """Drops HYPERLINK field runs and deleted text (w:del, w:rsidDel) from every parent in the tree"""
+        self.backend.clean(self.root, hyperlinks, deletions)
+        self._paragraph_index = None
+
     def remove_hyperlink_tags(self):
-        for parent in self.root.findall(".//w:r/..", self.namespace):
-        # Find all 'w:r' child tags with "HYPERLINK" text under the current parent
-            hyperlink_tags = [child for child in parent if child.tag == '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}r' and child.find("w:t", self.namespace) is not None and child.find("w:t", self.namespace).text == "HYPERLINK"]
-        for tag in hyperlink_tags:
-            parent.remove(tag)
+        self.clean_document(deletions=False)
 
     def remove_deleted_text(self):
-    # Remove any w:del tags
-        for parent in self.root.findall(".//w:del/..", self.namespace):
-            del_tags = [child for child in parent if child.tag == '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}del']
-        for tag in del_tags:
-            parent.remove(tag)
-
-    # Remove any tags with a w:rsidDel attribute
-        for parent in self.root.findall(".//*[@w:rsidDel]/..", self.namespace):
-            rsid_del_tags = [child for child in parent if "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}rsidDel" in child.attrib]
-        for tag in rsid_del_tags:
-            parent.remove(tag)
-        
-    
+        self.clean_document(hyperlinks=False)
+
+    def read_paragraph_style(self, p):
+        """Reads the pStyle, first rStyle and outline level of a paragraph in a single pass"""
+        return self.backend.paragraph_style(p)
+
+    def paragraph_style(self, p):
+        """Returns the ParagraphStyle of p from the paragraph index, reading it only when p is not indexed"""
+        if self._paragraph_index is not None:
+            position = self._paragraph_index.positions.get(p)
+            if position is not None:
+                return self._paragraph_index.style_info[position]
+        return self.read_paragraph_style(p)
+
     def is_heading2_section(self, p):
         """Returns True if the given paragraph section has been styled as a Heading2"""
-        return_val = False
-        heading_style_elem = p.find(".//w:pStyle[@w:val='Heading2']", self.namespace)
-        if heading_style_elem is not None:
-            return_val = True
-        return return_val
+        return self.style_resolver.paragraph_class(self.paragraph_style(p)) == 'Heading2'
     
     def is_heading3_section(self, p):
         """Returns True if the given paragraph section has been styled as a Heading3"""
-        return_val = False
-        heading_style_elem = p.find(".//w:pStyle[@w:val='Heading3']", self.namespace)
-        if heading_style_elem is not None:
-            return_val = True
-        return return_val
+        return self.style_resolver.paragraph_class(self.paragraph_style(p)) == 'Heading3'
     
-     #
     def is_heading4_section(self, p):
         """Returns 'Heading4Char' if styled as Heading4Char, 'Heading4' if styled as Heading4, and None otherwise"""
-        heading4char_elem = p.find(".//w:rStyle[@w:val='Heading4Char']", self.namespace)
-        heading4_elem = p.find(".//w:pStyle[@w:val='Heading4']", self.namespace)
-        
-        if heading4char_elem is not None:
+        style = self.paragraph_style(p)
+        if self.style_resolver.character_class(style) == 'Heading4Char':
             return 'Heading4Char'
-        elif heading4_elem is not None:
+        elif self.style_resolver.paragraph_class(style) == 'Heading4':
             return 'Heading4'
         else:
             return None  # Return None if neither Heading4Char nor Heading4 is found
@@ -90,129 +1185,1566 @@ class XmlParser:
     def get_section_text(self,p):
         """Returns the joined text of the text elements under the given paragraph tag"""
         return_val = ''
-        text_elems = p.findall('.//w:p', self.namespace)
-        if text_elems is not None:
-            #Neet to set the return_val to only be the items after the first element
-            return_val = ''.join([t.text for t in text_elems])
+        text_elems = self.backend.texts(p)
+        if text_elems:
+            return_val = ''.join([t for t in text_elems if t is not None])
         return return_val
 
     def get_section4_text(self,p):
         """Returns the joined text of the text elements under the given paragraph tag"""
         return_val = ''
-        text_elems = p.findall('.//w:t', self.namespace)
+        text_elems = self.backend.texts(p)
         if text_elems:
             # Set the return_val to only be the items after the first element
-            return_val = ''.join([t.text for t in text_elems[1:]]) if len(text_elems) > 1 else ''
+            return_val = ''.join([t for t in text_elems[1:] if t is not None]) if len(text_elems) > 1 else ''
         return return_val
     
-    def extract_text_after_heading4(self, p, index):
-        """Extracts and returns the text from paragraphs following a Heading4 until another Heading4 is encountered."""
-        text = []
-        paragraphs = self.root.findall('.//w:p', self.namespace)
-        for p in paragraphs[index + 1:]:  # Start from the paragraph after the current one
-            if self.is_heading4_section(p):  # Stop extraction if another Heading4 is encountered
-                break
-            else:
-                text_elems = p.findall('.//w:t', self.namespace)  # Find all text elements within the paragraph
-                paragraph_text = ' '.join([t.text for t in text_elems if t.text is not None])
-                text.append(paragraph_text)
-        return ' '.join(text)
+    def get_paragraph_text(self, p):
+        """Returns the text of the text elements under the given paragraph tag joined with spaces"""
+        text_elems = self.backend.texts(p)  # Text of all text elements within the paragraph
+        return ' '.join([t for t in text_elems if t is not None])
 
-    
-    
-    def extract_medium_severity_findings(self):
-        paragraphs = self.root.findall('.//w:p', self.namespace)
-        medium_severity_section_found = False
-        for p in paragraphs:
-            if self.is_heading2_section(p) and "Medium Severity Findings" in self.get_section_text(p):
-                medium_severity_section_found = True
-            elif medium_severity_section_found and self.is_heading3_section(p) and self.get_section_text(p).strip() != '':
-                self.findings_dict[f"Title {self.i}"] = self.get_section_text(p)
-                self.i = self.i + 1
-            elif medium_severity_section_found and self.is_heading2_section(p):
-                # another Heading2 found, means we are out of the "Medium Severity Findings" section
-                break
-        self.extract_low_severity_findings()
-
-    def extract_low_severity_findings(self):
-        paragraphs = self.root.findall('.//w:p', self.namespace)
-        medium_severity_section_found = False
-        for p in paragraphs:
-            if self.is_heading2_section(p) and "Low Severity Findings" in self.get_section_text(p):
-                medium_severity_section_found = True
-            elif medium_severity_section_found and self.is_heading3_section(p) and self.get_section_text(p).strip() != '':
-                 self.findings_dict[f"Title {self.i}"] = self.get_section_text(p)
-                 self.i = self.i + 1
-            elif medium_severity_section_found and self.is_heading2_section(p):
-                # another Heading2 found, means we are out of the "Low Severity Findings" section
-                break
-    
-    def extract_high_severity_findings(self):
-        paragraphs = self.root.findall('.//w:p', self.namespace)
-        high_severity_section_found = False
-        current_finding = {}
-        attributes_order = ["Severity", "Relevant CWEs", "Vulnerability Details", "Impact", "Recommendation", "Verification"]
-
-        title = None  # Initialize title variable outside of the loop
-
-        for i, p in enumerate(paragraphs):
-            if self.is_heading2_section(p) and "High Severity Findings" in self.get_section_text(p):
-                high_severity_section_found = True
-            elif high_severity_section_found and self.is_heading3_section(p) and self.get_section_text(p).strip() != '':
-                if current_finding:  # If there's already a finding being processed, add it to findings_dict
-                    title = current_finding.pop("Title", None)
-                    if title:  # Check if title is not None before using it as a key
-                        self.findings_dict[title] = current_finding  # Using the Title as the key
-                    current_finding = {}
-                title = self.get_section_text(p)  # Update title variable every time a new Title is found
-            
-            elif self.is_heading4_section(p): 
-               
-                heading4_type = self.is_heading4_section(p)
-                heading_text = self.get_section_text(p).strip()  # Assuming this method returns the text of the exheading
-                for attr in attributes_order:
-                    if attr in heading_text:
-                        if heading4_type == 'Heading4Char':
-                            current_finding[attr] = self.get_section4_text(p)
-                        elif heading4_type == 'Heading4':
-                            current_finding[attr] = self.extract_text_after_heading4(p, i)
-
-
-                if title:  # Check if title is not None before using it as a key
-                    self.findings_dict[title] = current_finding  # Update the finding with the current attributes and associated text
-
-            elif high_severity_section_found and self.is_heading2_section(p):
-                # another Heading2 found, means we are out of the "High Severity Findings" section
-                break
+    def extract_text_after_heading4(self, p, index, paragraph_index=None):
+        """Extracts and returns the text from paragraphs following a Heading4 until the next heading is encountered."""
+        if paragraph_index is None:
+            paragraph_index = self.paragraph_index
+        start, stop = paragraph_index.body_range(index)
+        return ' '.join([self.get_paragraph_text(p) for p in paragraph_index.paragraphs[start:stop]])
+
+    def section_severity(self, heading_text):
+        """Returns the severity of a Heading2 section from its text, or None if it is not a findings section"""
+        for section_text, severity in self.SEVERITY_SECTIONS:
+            if section_text in heading_text:
+                return severity
+        return None
 
+    def _walk_findings(self, paragraphs, severities, indexed, stop_early=False, lazy=False):
+        """State machine behind every extraction path.
+
+        Consumes (position, paragraph, heading class) triples in document order, tracking the current Heading2
+        severity section and the current Heading3 finding, and yields each Finding as soon as it is closed by
+        the next Heading3 or Heading2. Heading4 bodies are cut out of the paragraph index when indexed is True,
+        otherwise they are collected from the paragraphs as they go by. With stop_early the walk ends as soon as
+        every requested section has been closed, assuming each severity has a single section. With lazy, which
+        needs indexed, attribute texts are left as LazyText references into the tree.
+        """
+        severities = {Severity(severity) for severity in severities}
+        pending = set(severities)  # Requested sections that have not been closed yet
+        severity = None  # Severity of the current Heading2 section, None outside the requested sections
+        current_finding = None
+        body_attrs = []  # Heading4 attributes whose text is the paragraphs following the heading
+        body_text = []
+
+        for i, p, heading_class in paragraphs:
+            if body_attrs and heading_class:
+                for attr in body_attrs:
+                    current_finding[attr] = ' '.join(body_text)
+                body_attrs, body_text = [], []
+
+            if heading_class == 'Heading2':
+                # Any Heading2 closes the current section and its last finding
+                if current_finding is not None:
+                    yield current_finding
+                current_finding = None
+                pending.discard(severity)
+                if stop_early and not pending:
+                    return
+                severity = self.section_severity(self.get_section_text(p))
+                if severity not in severities:
+                    severity = None
+            elif severity is None:
+                continue
+            elif heading_class == 'Heading3':
+                heading_text = self.get_section_text(p)
+                if heading_text.strip() != '':
+                    if current_finding is not None:
+                        yield current_finding
+                    current_finding = Finding(heading_text, severity, self.filepath, self.vocabulary.names)
+            elif heading_class and current_finding is not None:
+                heading_text = self.get_section_text(p).strip()
+                for attr in self.vocabulary.match(heading_text):
+                    if lazy and heading_class == 'Heading4Char':
+                        current_finding[attr] = LazyText(self.get_section4_text, p)
+                    elif heading_class == 'Heading4Char':
+                        current_finding[attr] = self.get_section4_text(p)
+                    elif lazy:
+                        # Bound to the current index, so a later clean_document does not shift the range
+                        current_finding[attr] = LazyText(self.extract_text_after_heading4, p, i,
+                                                         self.paragraph_index)
+                    elif indexed:
+                        current_finding[attr] = self.extract_text_after_heading4(p, i)
+                    else:
+                        body_attrs.append(attr)
+            elif body_attrs:
+                body_text.append(self.get_paragraph_text(p))
+
+        for attr in body_attrs:
+            current_finding[attr] = ' '.join(body_text)
+        if current_finding is not None:
+            yield current_finding
+
+    def iter_findings(self, severities=SEVERITIES, stop_early=False, lazy=False):
+        """Yields every Finding of the requested severities in one pass over the tree.
+
+        With lazy, attribute texts are only joined when first read, which keeps title-only listings and counts
+        cheap. Lazy findings hold on to the tree until all their attributes have been read.
+        """
+        paragraph_index = self.paragraph_index
+        paragraphs = zip(range(len(paragraph_index)), paragraph_index.paragraphs, paragraph_index.styles)
+        return self._walk_findings(paragraphs, severities, indexed=True, stop_early=stop_early, lazy=lazy)
+
+    def extract_findings(self, severities=SEVERITIES, lazy=False):
+        """Adds every finding of the requested severities to findings_dict, keyed by (severity, title)"""
+        for finding in self.iter_findings(severities, lazy=lazy):
+            # Sections of different severities may hold findings with the same title
+            self.findings_dict[finding.severity.value, finding.title] = finding
         return self.findings_dict
 
+    def extract_medium_severity_findings(self, lazy=False):
+        return self.extract_findings(('Medium', 'Low'), lazy)
+
+    def extract_low_severity_findings(self, lazy=False):
+        return self.extract_findings(('Low',), lazy)
+    
+    def extract_high_severity_findings(self, lazy=False):
+        return self.extract_findings(('High',), lazy)
+
+    def iter_paragraphs(self, clean=True):
+        """Yields each w:p of the document as soon as it has been parsed, then clears it so memory stays flat.
+
+        With clean, the clean_document cleanup runs as a filter on the parse events: deleted elements are skipped
+        from their start tag on and HYPERLINK runs are dropped when they end, so no extra walk is needed.
+        """
+        if not self.backend.builds_trees:
+            with self.open_document() as source:
+                yield from self.backend.iter_paragraphs(source, clean)
+            return
+        stack = []
+        body_depth = None
+        p_depth = 0  # w:p nesting, text boxes can carry paragraphs of their own
+        drop_depth = None  # Depth of the deleted element currently being skipped
+        with self.open_document() as source:
+            for event, elem in self.backend.iterparse(source, ('start', 'end')):
+                if event == 'start':
+                    stack.append(elem)
+                    if elem.tag == W + 'body':
+                        body_depth = len(stack)
+                    elif elem.tag == W + 'p':
+                        p_depth += 1
+                    if clean and drop_depth is None and is_cleanup_target(elem, hyperlinks=False):
+                        drop_depth = len(stack)
+                    continue
+                depth = len(stack)
+                stack.pop()
+                if elem.tag == W + 'p':
+                    p_depth -= 1
+                if depth == drop_depth:
+                    drop_depth = None
+                    # A direct child of w:body may be gone already: parse events come in batches, and the end of
+                    # the previous child cleared w:body after this one had been added. It is cleared below anyway
+                    if stack and (body_depth is None or depth > body_depth + 1):
+                        stack[-1].remove(elem)
+                elif drop_depth is None:
+                    if elem.tag == W + 'p' and p_depth == 0:
+                        yield elem
+                        elem.clear()
+                    elif clean and p_depth and is_cleanup_target(elem, deletions=False):
+                        stack[-1].remove(elem)
+                if body_depth is not None and depth == body_depth + 1:
+                    # Direct child of w:body is complete, nothing below it is needed anymore
+                    stack[-1].clear()
+
+    def stream_findings(self, severities=SEVERITIES, stop_early=False):
+        """Yields each Finding straight off iterparse as soon as it is complete.
+
+        With stop_early, reading the input stops once the last requested section has closed, see _walk_findings.
+        """
+        paragraphs = self.iter_paragraphs()
+        # Paragraphs are seen once here, so read the style directly instead of through the index
+        classify = self.style_resolver.classify
+        classified = ((i, p, classify(self.read_paragraph_style(p))) for i, p in enumerate(paragraphs))
+        try:
+            yield from self._walk_findings(classified, severities, indexed=False, stop_early=stop_early)
+        finally:
+            paragraphs.close()  # Closes the input right away instead of whenever the generator is collected
+
+    def stream_high_severity_findings(self):
+        """Yields the findings of the High severity section as soon as each one is complete."""
+        return self.stream_findings(('High',))
+
+    @staticmethod
+    def print_finding(finding):
+        print(f"Title: {finding.title}")
+        if finding.change is not None:
+            print(f"\tChange: {finding.change}")
+        if finding.duplicate_of is not None:
+            print(f"\tDuplicate of: {finding.duplicate_of[1]} ({finding.duplicate_of[0]})")
+        for key, value in finding.items():
+            print(f"\t{key}: {value}")
+        print("\n")
 
     def print_findings(self):
-        for title, finding_details in self.findings_dict.items():
-            print(f"Title: {title}")
-            for key, value in finding_details.items():
-                print(f"\t{key}: {value}")
-            print("\n")  
+        for finding in self.findings_dict.values():
+            self.print_finding(finding)
             
                 
 
-def main():
-    input_file = input("Enter the file name: ")
+class SectionIndex:
+    """Byte offsets of the Heading2 sections, Heading3 findings and Heading4 attributes of one report.
+
+    It is built from a byte scan that parses the heading paragraphs only, and kept in a sidecar file next to the
+    report, so that a single finding can later be parsed out of its own byte range.
+    """
+
+    SUFFIX = '.sections.json'
+
+    def __init__(self, filepath, size, root_tag, body_end, sections, findings, style_resolver=DEFAULT_STYLES,
+                 mtime_ns=None, sha256=None):
+        self.filepath = filepath
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.sha256 = sha256  # Of the whole report file
+        self.root_tag = root_tag
+        self.body_end = body_end
+        self.style_resolver = style_resolver  # Saved too, so lookups do not read the style definitions again
+        self.sections = sections  # [severity, start, stop] of every Heading2 paragraph
+        # {'title', 'section', 'start', 'stop', 'attributes': [[name, heading offset]], 'sha256'} of every finding
+        self.findings = findings
+
+    @staticmethod
+    def sidecar_path(filepath):
+        return filepath + SectionIndex.SUFFIX
+
+    @staticmethod
+    def file_hash(filepath):
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as source:
+            for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @classmethod
+    def build(cls, filepath):
+        """Indexes the report, raising ValueError when its layout is not recognised"""
+        helper = XmlParser(filepath, streaming=True, backend='etree')
+        with helper._open_raw_document() as source:
+            scan = scan_sections(source, markers=helper.style_resolver.markers(('Heading2', 'Heading3', 'Heading4',
+                                                                                 'Heading4Char')))
+        if scan is None:
+            raise ValueError(f"{filepath}: no sections to index")
+        root_tag, headings, body_end = scan
+        sections = []
+        findings = []
+        headings_by_offset = {}
+        for offset, heading, nested in headings:
+            if offset in headings_by_offset:
+                continue  # A paragraph holding several heading markers
+            headings_by_offset[offset] = heading
+            try:
+                root = ET.fromstring(root_tag + heading + b'</w:document>')
+            except ET.ParseError:
+                raise ValueError(f"{filepath}: heading at byte {offset} could not be parsed")
+            helper.backend.clean(root, True, True)
+            if len(root) == 0:
+                continue  # A deleted heading paragraph, which the cleanup drops before the findings are read
+            p = root[0]
+            heading_class = helper.style_resolver.classify(helper.read_paragraph_style(p))
+            if nested and heading_class in ('Heading2', 'Heading3'):
+                # Its range would not cut along the document structure, attribute headings may sit anywhere
+                raise ValueError(f"{filepath}: heading at byte {offset} is inside a table or content control")
+            current = findings[-1] if findings and findings[-1]['stop'] is None else None
+            # Same rules as _walk_findings: Heading2 closes a finding, so does a Heading3 with a title
+            if heading_class == 'Heading2':
+                if current is not None:
+                    current['stop'] = offset
+                severity = helper.section_severity(helper.get_section_text(p))
+                sections.append([severity and severity.value, offset, offset + len(heading)])
+            elif not sections or sections[-1][0] is None:
+                continue
+            elif heading_class == 'Heading3':
+                title = helper.get_section_text(p)
+                if title.strip() != '':
+                    if current is not None:
+                        current['stop'] = offset
+                    findings.append({'title': title, 'section': len(sections) - 1, 'start': offset, 'stop': None,
+                                     'attributes': []})
+            elif heading_class and current is not None:
+                heading_text = helper.get_section_text(p).strip()
+                current['attributes'].extend([attr, offset] for attr in helper.vocabulary.match(heading_text))
+        if findings and findings[-1]['stop'] is None:
+            findings[-1]['stop'] = body_end
+
+        # One more forward pass hashes what a lookup will parse, the section heading and the finding's range
+        with helper._open_raw_document() as source:
+            for finding in findings:
+                section_start = sections[finding['section']][1]
+                data = RangeReader(source, [(finding['start'], finding['stop'])]).read()
+                finding['sha256'] = hashlib.sha256(headings_by_offset[section_start] + data).hexdigest()
+        stat = os.stat(filepath)
+        return cls(filepath, stat.st_size, root_tag, body_end, sections, findings, helper.style_resolver,
+                   stat.st_mtime_ns, cls.file_hash(filepath))
+
+    @classmethod
+    def load(cls, filepath):
+        """Returns the index in the sidecar of the report, or None when there is none or the report's size or
+        modification time changed"""
+        try:
+            with open(cls.sidecar_path(filepath), encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        stat = os.stat(filepath)
+        if (data.get('version') != EXTRACTOR_VERSION or data.get('size') != stat.st_size
+                or data.get('mtime_ns') != stat.st_mtime_ns):
+            return None
+        return cls(filepath, data['size'], data['root_tag'].encode('latin-1'), data['body_end'], data['sections'],
+                   data['findings'], StyleResolver(*data['styles']), data['mtime_ns'], data.get('sha256'))
+
+    def save(self):
+        data = {'version': EXTRACTOR_VERSION, 'size': self.size, 'mtime_ns': self.mtime_ns, 'sha256': self.sha256,
+                'root_tag': self.root_tag.decode('latin-1'),
+                'body_end': self.body_end, 'sections': self.sections, 'findings': self.findings,
+                'styles': [self.style_resolver.paragraph_classes, self.style_resolver.character_classes]}
+        path = self.sidecar_path(self.filepath)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def try_save(self):
+        """Saves the sidecar, leaving the index in memory only when it cannot be written, e.g. to read-only reports"""
+        try:
+            self.save()
+        except OSError:
+            pass
+
+    @classmethod
+    def open(cls, filepath):
+        """Returns the index of the report from its sidecar, building and saving it first when it is missing or stale"""
+        if not os.path.isfile(filepath):
+            raise ValueError("File not found")
+        index = cls.load(filepath)
+        if index is None:
+            index = cls.build(filepath)
+            index.try_save()
+        return index
+
+    def titles(self):
+        return [finding['title'] for finding in self.findings]
+
+    def finding(self, title, backend=None):
+        """Parses the finding with the given title out of its byte range, returns None if the report has none"""
+        entry = next((finding for finding in self.findings if finding['title'] == title), None)
+        if entry is None:
+            if self.file_hash(self.filepath) == self.sha256:
+                return None
+            # The report changed in place keeping its size and modification time, the title may be new
+            return self.rebuild().finding(title, backend)
+        severity, section_start, section_stop = self.sections[entry['section']]
+        helper = XmlParser(self.filepath, streaming=True)
+        with helper._open_raw_document() as source:
+            data = RangeReader(source, [(section_start, section_stop), (entry['start'], entry['stop'])]).read()
+        if hashlib.sha256(data).hexdigest() != entry['sha256']:
+            # The report changed in place without changing size
+            return self.rebuild().finding(title, backend)
+        document = self.root_tag + b'<w:body>' + data + b'</w:body></w:document>'
+        parser = XmlParser(self.filepath, backend=backend, skip_binary=True, pieces=[document],
+                           style_resolver=self.style_resolver)
+        try:
+            if parser.streaming:
+                findings = parser.stream_findings((severity,))
+            else:
+                parser.clean_document()
+                findings = parser.iter_findings((severity,))
+            return next((finding for finding in findings if finding.title == title), None)
+        except parser.backend.ParseError:
+            # The range did not cut cleanly along the document structure, read the whole section after all
+            findings = iter_report_findings(self.filepath, (severity,), backend)
+            return next((finding for finding in findings if finding.title == title), None)
+
+    def rebuild(self):
+        """Builds and saves the index of the report again, returns the new index"""
+        index = self.build(self.filepath)
+        index.try_save()
+        return index
+
+    def parse_findings(self, entries, backend=None, vocabulary=DEFAULT_VOCABULARY):
+        """Returns the findings of the given entries, in document order, parsed together out of their byte ranges"""
+        ranges = []
+        severities = set()
+        section = None
+        for entry in entries:
+            if entry['section'] != section:
+                section = entry['section']
+                severity, section_start, section_stop = self.sections[section]
+                ranges.append((section_start, section_stop))
+                severities.add(severity)
+            ranges.append((entry['start'], entry['stop']))
+        if not entries:
+            return []
+        helper = XmlParser(self.filepath, streaming=True)
+        with helper._open_raw_document() as source:
+            data = RangeReader(source, ranges).read()
+        document = self.root_tag + b'<w:body>' + data + b'</w:body></w:document>'
+        parser = XmlParser(self.filepath, backend=backend, skip_binary=True, pieces=[document],
+                           style_resolver=self.style_resolver, vocabulary=vocabulary)
+        if parser.streaming:
+            findings = list(parser.stream_findings(tuple(severities)))
+        else:
+            parser.clean_document()
+            findings = list(parser.iter_findings(tuple(severities)))
+        if len(findings) != len(entries):
+            raise ValueError(f"{self.filepath}: {len(findings)} findings parsed out of {len(entries)} ranges")
+        return findings
+
+
+def lookup_finding(filepath, title, backend=None):
+    """Returns one finding of a report parsed on its own, through the report's section index"""
+    return SectionIndex.open(filepath).finding(title, backend)
+
+
+class DeltaState:
+    """Content hashes of the findings of every report at its last incremental run, one JSON file per report.
+
+    The hashes of a new run are staged next to the committed ones, and only replace them on commit(), once the
+    delta they describe has been delivered. A run that fails before that outputs the same delta again.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, filepath):
+        name = hashlib.sha256(os.path.abspath(filepath).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + '.json')
+
+    def load(self, filepath):
+        """Returns the [severity, title, hash] of every finding the report had at its last run, [] for a new one"""
+        try:
+            with open(self._path(filepath), encoding='utf-8') as f:
+                return json.load(f)['findings']
+        except (OSError, ValueError, KeyError):
+            return []
+
+    def stage(self, filepath, findings):
+        """Keeps the hashes of the report's current findings aside until commit()"""
+        path = self._path(filepath) + '.staged'
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'report': filepath, 'findings': findings}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def commit(self, filepath):
+        """Makes the staged hashes of the report the ones the next run compares with"""
+        path = self._path(filepath)
+        try:
+            os.replace(path + '.staged', path)
+        except FileNotFoundError:
+            pass  # Nothing staged, e.g. the report could not be read
+
+
+def extract_report_delta(filepath, state, severities=SEVERITIES, backend=None, vocabulary=DEFAULT_VOCABULARY):
+    """Returns the findings of a report that were added, changed or removed since its last run kept in state.
+
+    The report is indexed with a byte scan and the hash of every finding's byte range is compared with the last
+    run's. Only the added and changed findings are parsed, out of their own ranges, and removed findings come
+    back without attributes. The change of each finding tells which it is. Only the given severities are compared,
+    and findings are matched on severity and title, duplicate titles in order. The new hashes are only staged,
+    state.commit(filepath) once the delta has been delivered.
+
+    Reports the byte scan cannot index, e.g. with headings inside tables, are extracted whole instead and the
+    hash of every finding's extracted attributes is compared.
+    """
+    try:
+        index = SectionIndex.build(filepath)
+    except ValueError:
+        index = None
+    if index is not None:
+        candidates = [(index.sections[entry['section']][0], entry['title'], entry['sha256'], entry)
+                      for entry in index.findings]
+    else:
+        candidates = []
+        for finding in iter_report_findings(filepath, severities, backend, vocabulary=vocabulary):
+            content = json.dumps(finding.items(), ensure_ascii=False).encode('utf-8')
+            candidates.append((finding.severity.value, finding.title, hashlib.sha256(content).hexdigest(), finding))
+    # Another extractor or vocabulary may read the same bytes differently
+    config = json.dumps([EXTRACTOR_VERSION, vocabulary.config()]).encode('utf-8')
+    previous = {}
+    current = []
+    for severity, title, digest in state.load(filepath):
+        if severity in severities:
+            previous.setdefault((severity, title), []).append(digest)
+        else:
+            current.append([severity, title, digest])  # Kept for the run that asks for that severity again
+    entries = []
+    changes = []
+    for severity, title, content_hash, entry in candidates:
+        if severity not in severities:
+            continue
+        digest = hashlib.sha256(config + content_hash.encode('ascii')).hexdigest()
+        current.append([severity, title, digest])
+        digests = previous.get((severity, title))
+        if digests:
+            if digests.pop(0) == digest:
+                continue
+            changes.append('changed')
+        else:
+            changes.append('added')
+        entries.append(entry)
+    # The entries of an unindexed report are its findings already
+    findings = index.parse_findings(entries, backend, vocabulary) if index is not None else entries
+    for finding, change in zip(findings, changes):
+        finding.change = change
+    for (severity, title), digests in previous.items():
+        for _ in digests:
+            finding = Finding(title, Severity(severity), filepath, vocabulary.names)
+            finding.change = 'removed'
+            findings.append(finding)
+    state.stage(filepath, current)
+    return findings
+
+
+class ResultCache:
+    """On-disk cache of extracted findings keyed by the hash of the report bytes and the extractor configuration.
+
+    Entries are JSON files named after their key. A hit touches the file's mtime, and evict() removes the least
+    recently used entries until the cache fits in max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, filepath, severities, vocabulary=DEFAULT_VOCABULARY, stop_early=False):
+        """Returns the cache key of a report extracted for the given severities, attribute vocabulary and mode"""
+        digest = hashlib.sha256()
+        config = [EXTRACTOR_VERSION, list(severities), vocabulary.config(), stop_early,
+                  [(section_text, severity.value) for section_text, severity in XmlParser.SEVERITY_SECTIONS]]
+        digest.update(json.dumps(config).encode('utf-8'))
+        with open(filepath, 'rb') as source:
+            for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key, names=ATTRIBUTE_NAMES):
+        """Returns the cached findings for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as cached:
+                records = json.load(cached)
+            os.utime(path)  # Mark as recently used
+        except (OSError, ValueError):
+            return None
+        return [Finding.from_record(record, names) for record in records]
+
+    def put(self, key, findings):
+        """Stores the findings of a report under key"""
+        path = self._path(key)
+        # Write then rename, so concurrent batch workers never see a half written entry
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as cached:
+            json.dump([finding.to_record() for finding in findings], cached)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """Deletes the least recently used entries until the cache is no larger than max_bytes"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class PrintSink:
+    """Prints findings to stdout in the tab-indented text format"""
+
+    def __init__(self, show_reports=False):
+        self.show_reports = show_reports
+        self._report = None
+
+    def write(self, finding):
+        if self.show_reports and finding.report != self._report:
+            print(f"Report: {finding.report}")
+            self._report = finding.report
+        XmlParser.print_finding(finding)
+
+    def end_report(self, report):
+        pass
+
+    def close(self):
+        pass
+
+
+class NearDuplicateFilter:
+    """Sink stage that spots near-duplicate findings across reports, with MinHash signatures and an LSH index.
+
+    A finding's title and attribute texts are shingled into word 3-grams. One SHAKE-128 digest per shingle
+    supplies all MINHASH_PERMUTATIONS hash values, and the signature is their column-wise minimum. Signatures are
+    cut into LSH_BANDS bands, so a finding is only compared with earlier findings that share a band with it. It
+    is a duplicate when the signatures agree on at least threshold of their values, the estimated Jaccard
+    similarity. Duplicates are passed on with duplicate_of set to the first finding seen, or dropped with drop.
+    Removed findings of an incremental run always pass through.
+    """
+
+    def __init__(self, sink, threshold=DEDUP_THRESHOLD, drop=False):
+        self.sink = sink
+        self.threshold = threshold
+        self.drop = drop
+        self.buckets = {}  # (band, band values) -> indexes of the findings with that band
+        self.signatures = []
+        self.origins = []  # (report, title) of every indexed finding
+        self.duplicates = 0
+
+    @staticmethod
+    def signature(finding):
+        """Returns the MinHash signature of a finding's title and attribute texts"""
+        tokens = tokenize(' '.join([finding.title] + [text for _, text in finding.items()]))
+        shingles = {' '.join(tokens[i:i + 3]) for i in range(max(len(tokens) - 2, 1))}
+        size = 4 * MINHASH_PERMUTATIONS
+        values = array('I')
+        values.frombytes(b''.join(hashlib.shake_128(shingle.encode('utf-8')).digest(size) for shingle in shingles))
+        # Hash value i of every shingle sits at i, i + MINHASH_PERMUTATIONS, ...
+        return tuple(min(values[i::MINHASH_PERMUTATIONS]) for i in range(MINHASH_PERMUTATIONS))
+
+    def find_duplicate(self, signature):
+        """Returns the index of the most similar earlier finding at or above the threshold, or None"""
+        rows = MINHASH_PERMUTATIONS // LSH_BANDS
+        candidates = set()
+        for band in range(LSH_BANDS):
+            candidates.update(self.buckets.get((band, signature[band * rows:(band + 1) * rows]), ()))
+        best = None
+        best_similarity = self.threshold
+        for candidate in sorted(candidates):
+            similarity = sum(a == b for a, b in zip(signature, self.signatures[candidate])) / MINHASH_PERMUTATIONS
+            if similarity >= best_similarity and (best is None or similarity > best_similarity):
+                best, best_similarity = candidate, similarity
+        return best
+
+    def write(self, finding):
+        if finding.change == 'removed':
+            # A removal from an incremental run carries its title only, it is neither compared nor indexed
+            self.sink.write(finding)
+            return
+        signature = self.signature(finding)
+        duplicate = self.find_duplicate(signature)
+        if duplicate is not None:
+            # Only first occurrences are indexed, so every duplicate points at one canonical finding
+            self.duplicates += 1
+            finding.duplicate_of = self.origins[duplicate]
+            if not self.drop:
+                self.sink.write(finding)
+            return
+        index = len(self.signatures)
+        self.signatures.append(signature)
+        self.origins.append((finding.report, finding.title))
+        rows = MINHASH_PERMUTATIONS // LSH_BANDS
+        for band in range(LSH_BANDS):
+            self.buckets.setdefault((band, signature[band * rows:(band + 1) * rows]), []).append(index)
+        self.sink.write(finding)
+
+    def end_report(self, report):
+        self.sink.end_report(report)
+
+    def close(self):
+        self.sink.close()
+
+
+class TeeSink:
+    """Hands every finding to several sinks"""
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def write(self, finding):
+        for sink in self.sinks:
+            sink.write(finding)
+
+    def end_report(self, report):
+        for sink in self.sinks:
+            sink.end_report(report)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class JsonlWriter:
+    """Writes one JSON object per finding (JSON Lines) to a buffered file, gzip compressed if asked to.
+
+    path '-' writes to stdout. compress defaults to True for paths ending in .gz.
+    """
+
+    def __init__(self, path, compress=None, buffer_size=JSONL_BUFFER_SIZE):
+        if compress is None:
+            compress = path.endswith('.gz')
+        self._raw = None
+        if path == '-':
+            raw = sys.stdout.buffer
+        else:
+            raw = self._raw = open(path, 'wb', buffering=buffer_size)
+        self._gzip = gzip.GzipFile(fileobj=raw, mode='wb') if compress else None
+        self._out = io.TextIOWrapper(self._gzip or raw, encoding='utf-8', write_through=path == '-' and not compress)
+
+    def write(self, finding):
+        self._out.write(json.dumps(finding.to_record(), ensure_ascii=False))
+        self._out.write('\n')
+
+    def end_report(self, report):
+        """Pushes what is buffered so far to the file, so readers can consume a batch that is still running"""
+        self._out.flush()
+        if self._gzip is not None:
+            self._gzip.flush()
+
+    def close(self):
+        self._out.flush()
+        self._out.detach()
+        if self._gzip is not None:
+            self._gzip.close()
+        if self._raw is not None:
+            self._raw.close()
+        else:
+            sys.stdout.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class HttpConnectionPool:
+    """Keep-alive HTTP/1.1 connections to the host of one URL, for asyncio.
+
+    At most size requests run at once. A connection goes back to the pool after its response has been read, and
+    is closed instead when the server asks for it or the request failed.
+    """
+
+    def __init__(self, url, size=CANOPY_CONCURRENCY, timeout=CANOPY_TIMEOUT, headers=None):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f"Not an http(s) URL: {url}")
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context() if parts.scheme == 'https' else None
+        self.path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        self.host_header = parts.netloc.rpartition('@')[2]
+        self.headers = headers or {}
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(size)
+        self._idle = []  # (reader, writer) of the open connections no request uses
+        self.connections = 0  # Opened so far
+
+    async def request(self, method, body=b'', headers=None):
+        """Sends a request to the URL, returns (status, headers with lowercased names, body)"""
+        async with self._slots:
+            if self._idle:
+                reader, writer = self._idle.pop()
+            else:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.timeout)
+                self.connections += 1
+            try:
+                status, response_headers, data = await asyncio.wait_for(
+                    self._exchange(reader, writer, method, body, {**self.headers, **(headers or {})}), self.timeout)
+            except BaseException:
+                writer.close()
+                raise
+            if response_headers.get('connection', '').lower() == 'close':
+                writer.close()
+            else:
+                self._idle.append((reader, writer))
+            return status, response_headers, data
+
+    async def _exchange(self, reader, writer, method, body, headers):
+        lines = [f"{method} {self.path} HTTP/1.1", f"Host: {self.host_header}", f"Content-Length: {len(body)}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+        status_line = await reader.readline()
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            # Also what a kept-alive connection the server has closed meanwhile reads like
+            raise ConnectionError(f"Malformed HTTP status line: {status_line[:80]!r}") from None
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass  # Trailers
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            data = await reader.readexactly(int(response_headers['content-length']))
+        else:
+            data = await reader.read()
+            response_headers['connection'] = 'close'  # The body ran to the end of the connection
+        return status, response_headers, data
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+        for _, writer in idle:
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+class CanopyUploader:
+    """Uploads findings to Canopy in batches, from an asyncio event loop running in a background thread.
+
+    write() collects batch_size records and hands the batch to a queue of queue_size batches, blocking while the
+    queue is full, so extraction never runs far ahead of the uploads. concurrency workers POST the batches as
+    {"findings": [...]} over a pool of keep-alive connections, with the hash of the body as Idempotency-Key so a
+    retried batch is not imported twice. Connection errors, timeouts, 429 and 5xx answers are retried with
+    exponential backoff and full jitter, or after Retry-After. Batches that still fail are counted in failed.
+    """
+
+    def __init__(self, url, token=None, batch_size=CANOPY_BATCH_SIZE, concurrency=CANOPY_CONCURRENCY,
+                 queue_size=CANOPY_QUEUE_SIZE, retries=CANOPY_RETRIES, backoff=CANOPY_BACKOFF, timeout=CANOPY_TIMEOUT):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+        self.url = url
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.uploaded = 0
+        self.failed = 0
+        self.retried = 0  # Attempts that were repeated
+        self.error = None  # Last error of a failed batch
+        self._batch = []
+        self._random = random.Random()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='canopy-upload', daemon=True)
+        self._thread.start()
+        try:
+            self._call(self._start(url, headers, queue_size, timeout))
+        except BaseException:
+            self._stop()
+            raise
+
+    def _call(self, coroutine):
+        """Runs a coroutine on the uploader's loop and waits for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _start(self, url, headers, queue_size, timeout):
+        # Queues and semaphores are made on the loop that uses them
+        self.pool = HttpConnectionPool(url, self.concurrency, timeout, headers)
+        self._queue = asyncio.Queue(queue_size)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    def write(self, finding):
+        self._batch.append(finding.to_record())
+        if len(self._batch) >= self.batch_size:
+            self._submit()
+
+    def _submit(self):
+        batch, self._batch = self._batch, []
+        self._call(self._queue.put(batch))  # Blocks while the queue is full
+
+    def end_report(self, report):
+        pass  # Batches run across reports
+
+    async def _work(self):
+        while True:
+            batch = await self._queue.get()
+            if batch is None:
+                return
+            try:
+                await self._upload(batch)
+                self.uploaded += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                self.error = e
+
+    async def _upload(self, batch):
+        body = json.dumps({'findings': batch}, ensure_ascii=False).encode('utf-8')
+        headers = {'Idempotency-Key': hashlib.sha256(body).hexdigest()}
+        for attempt in range(self.retries + 1):
+            retry_after = 0.0
+            try:
+                status, response_headers, data = await self.pool.request('POST', body, headers)
+            except (OSError, EOFError, asyncio.TimeoutError) as e:
+                error = e
+            else:
+                if 200 <= status < 300:
+                    return
+                error = RuntimeError(f"Canopy answered HTTP {status}: {data[:200].decode('utf-8', 'replace')}")
+                if status != 429 and status < 500:
+                    raise error  # The batch itself was refused, sending it again will not help
+                try:
+                    retry_after = float(response_headers.get('retry-after', 0))
+                except ValueError:
+                    pass  # An HTTP date, the backoff will do
+            if attempt == self.retries:
+                raise error
+            self.retried += 1
+            # Full jitter spreads the retries of the workers that failed together
+            backoff = self._random.uniform(0, min(CANOPY_BACKOFF_MAX, self.backoff * 2 ** attempt))
+            await asyncio.sleep(max(retry_after, backoff))
+
+    async def _finish(self):
+        for _ in self._workers:
+            await self._queue.put(None)
+        await asyncio.gather(*self._workers)
+        await self.pool.close()
+
+    def close(self):
+        """Uploads the findings still collected and waits for every upload to end"""
+        if self._batch:
+            self._submit()
+        try:
+            self._call(self._finish())
+        finally:
+            self._stop()
+        if self.failed:
+            print(f"Canopy: {self.failed} findings not uploaded, {self.uploaded} uploaded. Last error: {self.error}",
+                  file=sys.stderr)
+
+    def _stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SqliteStore:
+    """SQLite database of extracted findings, written like the other sinks and queried by severity, CWE, report or title.
+
+    Findings are buffered per report and written with executemany in transactions of about batch_size findings.
+    A report that is stored again replaces its previous findings. The database runs in WAL mode, so queries can
+    run while a batch is still writing.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, mtime REAL, stored_at REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS findings (
+            report_id INTEGER NOT NULL, position INTEGER NOT NULL, severity TEXT NOT NULL, title TEXT NOT NULL,
+            attributes TEXT NOT NULL, PRIMARY KEY (report_id, position)) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS finding_cwes (
+            cwe TEXT NOT NULL, report_id INTEGER NOT NULL, position INTEGER NOT NULL,
+            PRIMARY KEY (cwe, report_id, position)) WITHOUT ROWID;
+        -- Findings of a report are found through their primary key, CWEs through theirs
+        CREATE INDEX IF NOT EXISTS findings_severity ON findings (severity);
+        CREATE INDEX IF NOT EXISTS findings_title ON findings (title);
+        CREATE INDEX IF NOT EXISTS finding_cwes_finding ON finding_cwes (report_id, position);
+    """
+
+    def __init__(self, path, batch_size=SQLITE_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')  # Durable enough with WAL, and much faster
+        self.connection.executescript(self.SCHEMA)
+        self._findings = []  # Findings of the report being written
+        self._reports = []  # (report, findings) pairs waiting for the next transaction
+        self._pending = 0
+
+    def write(self, finding):
+        self._findings.append(finding)
+
+    def end_report(self, report):
+        self._reports.append((report, self._findings))
+        self._pending += len(self._findings) + 1
+        self._findings = []
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered reports in one transaction"""
+        if not self._reports:
+            return
+        finding_rows = []
+        cwe_rows = []
+        with self.connection:
+            for report, findings in self._reports:
+                mtime = os.path.getmtime(report) if os.path.isfile(report) else None
+                self.connection.execute(
+                    'INSERT INTO reports (path, mtime, stored_at) VALUES (?, ?, ?) '
+                    'ON CONFLICT (path) DO UPDATE SET mtime = excluded.mtime, stored_at = excluded.stored_at',
+                    (report, mtime, time.time()))
+                report_id = self.connection.execute('SELECT id FROM reports WHERE path = ?', (report,)).fetchone()[0]
+                self.connection.execute('DELETE FROM findings WHERE report_id = ?', (report_id,))
+                self.connection.execute('DELETE FROM finding_cwes WHERE report_id = ?', (report_id,))
+                for position, finding in enumerate(findings):
+                    finding_rows.append((report_id, position, finding.severity.value, finding.title,
+                                         json.dumps(finding.attributes, ensure_ascii=False)))
+                    cwe_rows.extend((cwe, report_id, position) for cwe in set(finding.cwes))
+            self.connection.executemany('INSERT INTO findings VALUES (?, ?, ?, ?, ?)', finding_rows)
+            self.connection.executemany('INSERT INTO finding_cwes VALUES (?, ?, ?)', cwe_rows)
+        self._reports = []
+        self._pending = 0
+
+    def query(self, severities=None, cwes=None, report=None, title=None, since=None, names=ATTRIBUTE_NAMES):
+        """Returns the stored findings matching every given filter, in report and document order.
+
+        severities and cwes match any of their values, report is a glob pattern on the report path, title a
+        substring of the finding title and since a timestamp the report file must have been modified after.
+        """
+        conditions = []
+        params = []
+        if severities:
+            conditions.append(f"f.severity IN ({', '.join('?' * len(severities))})")
+            params.extend(Severity(severity).value for severity in severities)
+        if cwes:
+            conditions.append('(f.report_id, f.position) IN (SELECT report_id, position FROM finding_cwes '
+                              f"WHERE cwe IN ({', '.join('?' * len(cwes))}))")
+            params.extend(cwes)
+        if report is not None:
+            conditions.append('r.path GLOB ?')
+            params.append(report)
+        if title is not None:
+            conditions.append("f.title LIKE ? ESCAPE '\\'")
+            params.append('%' + re.sub(r'([%_\\])', r'\\\1', title) + '%')
+        if since is not None:
+            conditions.append('r.mtime >= ?')
+            params.append(since)
+        sql = ('SELECT r.path, f.severity, f.title, f.attributes FROM findings f JOIN reports r ON r.id = f.report_id'
+               + (' WHERE ' + ' AND '.join(conditions) if conditions else '') + ' ORDER BY r.path, f.position')
+        return [Finding.from_record({'report': path, 'severity': severity, 'title': title,
+                                     'attributes': json.loads(attributes)}, names)
+                for path, severity, title, attributes in self.connection.execute(sql, params)]
+
+    def close(self):
+        if self._findings:
+            self.end_report(self._findings[0].report)
+        self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def tokenize(text):
+    """Returns the lowercased word tokens of a text, the terms of the full-text index"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class FullTextIndex:
+    """Incremental positional inverted index over finding titles and attribute texts, kept in a directory.
+
+    It is written like the other sinks. Every flush adds a segment file holding, for each term and field, one
+    array of doc id deltas, term frequencies and position deltas, in the smallest array typecode that fits.
+    meta.json lists the live documents. Indexing a report again drops its old documents from there instead of
+    rewriting any segment, and compact() merges the segments and leaves the dropped postings behind. With
+    read_only, an existing index is searched without anything being written, ValueError if there is none.
+    """
+
+    def __init__(self, directory, batch_size=FULLTEXT_BATCH_SIZE, read_only=False):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.read_only = read_only
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            if read_only:
+                raise ValueError(f"No full-text index in {directory}") from None
+            meta = {'next_doc': 0, 'next_segment': 0, 'segments': [], 'docs': {}, 'reports': {}}
+        self.next_doc = meta['next_doc']
+        self.next_segment = meta['next_segment']
+        self.segments = meta['segments']
+        self.docs = {int(doc): info for doc, info in meta['docs'].items()}  # doc -> [report, position, severity, title, length]
+        self.reports = meta['reports']  # report -> its doc ids
+        self._findings = []  # Findings of the report being written
+        self._postings = {}  # term -> field -> doc -> positions, not flushed yet
+        self._pending = 0
+        self._open_segments = {}
+
+    def write(self, finding):
+        if self.read_only:
+            raise ValueError("The full-text index was opened read-only")
+        self._findings.append(finding)
+
+    def end_report(self, report):
+        """Indexes the findings written since the last end_report as the report's documents, replacing older ones"""
+        for doc in self.reports.pop(report, []):
+            self.docs.pop(doc, None)
+        doc_ids = []
+        for position, finding in enumerate(self._findings):
+            doc = self.next_doc
+            self.next_doc += 1
+            length = 0
+            for field, text in [('title', finding.title)] + finding.items():
+                tokens = tokenize(text)
+                length += len(tokens)
+                for i, token in enumerate(tokens):
+                    self._postings.setdefault(token, {}).setdefault(field, {}).setdefault(doc, []).append(i)
+            self.docs[doc] = [report, position, finding.severity.value, finding.title, length]
+            doc_ids.append(doc)
+        self.reports[report] = doc_ids
+        self._pending += len(doc_ids) + 1
+        self._findings = []
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the pending postings as a new segment and commits meta.json"""
+        if self.read_only:
+            raise ValueError("The full-text index was opened read-only")
+        if self._postings:
+            name = f"segment-{self.next_segment:06d}.bin"
+            self.next_segment += 1
+            self._write_segment(name, self._postings)
+            self.segments.append(name)
+            self._postings = {}
+        self._pending = 0
+        meta = {'next_doc': self.next_doc, 'next_segment': self.next_segment, 'segments': self.segments,
+                'docs': self.docs, 'reports': self.reports}
+        path = os.path.join(self.directory, 'meta.json')
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, path)  # The commit point, a segment is not used before meta.json lists it
+
+    def _write_segment(self, name, postings):
+        terms = {}
+        chunks = []
+        offset = 0
+        for term in sorted(postings):
+            fields = terms[term] = {}
+            for field, docs in postings[term].items():
+                first_doc = previous = min(docs)
+                values = []
+                for doc in sorted(docs):
+                    positions = docs[doc]
+                    values.append(doc - previous)
+                    values.append(len(positions))
+                    values.extend(position - before for position, before in zip(positions, [0] + positions[:-1]))
+                    previous = doc
+                largest = max(values)
+                typecode = next(code for code in 'BHIQ' if largest < 1 << 8 * array(code).itemsize)
+                data = array(typecode, values).tobytes()
+                fields[field] = [offset, len(values), typecode, first_doc]
+                chunks.append(data)
+                offset += len(data)
+        header = json.dumps({'byteorder': sys.byteorder, 'terms': terms}, ensure_ascii=False).encode('utf-8')
+        with open(os.path.join(self.directory, name), 'wb') as f:
+            f.write(len(header).to_bytes(8, 'little'))
+            f.write(header)
+            for data in chunks:
+                f.write(data)
+
+    def _segment(self, name):
+        """Returns (header, postings data) of a segment, the data memory-mapped"""
+        if name not in self._open_segments:
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                size = int.from_bytes(f.read(8), 'little')
+                header = json.loads(f.read(size))
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._open_segments[name] = (header, mapped, memoryview(mapped)[8 + size:])
+        header, _, data = self._open_segments[name]
+        return header, data
+
+    def _term_postings(self, term):
+        """Yields (field, doc, positions) for every live document holding term, flushed or not"""
+        for name in self.segments:
+            header, data = self._segment(name)
+            for field, (offset, count, typecode, first_doc) in header['terms'].get(term, {}).items():
+                values = array(typecode)
+                values.frombytes(data[offset:offset + count * values.itemsize])
+                if header['byteorder'] != sys.byteorder:
+                    values.byteswap()
+                doc = first_doc
+                i = 0
+                while i < count:
+                    doc += values[i]
+                    frequency = values[i + 1]
+                    positions = list(accumulate(values[i + 2:i + 2 + frequency]))
+                    i += 2 + frequency
+                    if doc in self.docs:
+                        yield field, doc, positions
+        for field, docs in self._postings.get(term, {}).items():
+            for doc, positions in docs.items():
+                if doc in self.docs:
+                    yield field, doc, positions
+
+    def _frequencies(self, terms):
+        """Returns doc -> field-weighted number of times the terms occur consecutively in one field"""
+        postings = []
+        for term in terms:
+            postings.append({(field, doc): positions for field, doc, positions in self._term_postings(term)})
+        frequencies = {}
+        for (field, doc), positions in postings[0].items():
+            following = [set(other.get((field, doc), ())) for other in postings[1:]]
+            count = sum(1 for position in positions
+                        if all(position + k in others for k, others in enumerate(following, 1)))
+            if count:
+                frequencies[doc] = frequencies.get(doc, 0) + FULLTEXT_FIELD_WEIGHTS.get(field, 1.0) * count
+        return frequencies
+
+    def search(self, query, limit=10):
+        """Returns the best (score, report, position, severity, title) hits for a query, highest score first.
+
+        Every word of the query must occur. "Quoted phrases", and words made of several terms like CWE-79, must
+        occur as consecutive terms of one field. Hits are ranked with BM25, title matches counting double.
+        """
+        clauses = [tokenize(match.group(1) or match.group(2)) for match in QUERY_PATTERN.finditer(query)]
+        clauses = [terms for terms in clauses if terms]
+        if not clauses or not self.docs:
+            return []
+        total = len(self.docs)
+        average_length = sum(info[4] for info in self.docs.values()) / total or 1
+        scores = None
+        for terms in clauses:
+            frequencies = self._frequencies(terms)
+            idf = math.log(1 + (total - len(frequencies) + 0.5) / (len(frequencies) + 0.5))
+            clause_scores = {}
+            for doc, frequency in frequencies.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.docs[doc][4] / average_length)
+                clause_scores[doc] = idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+            if scores is None:
+                scores = clause_scores
+            else:
+                scores = {doc: score + clause_scores[doc] for doc, score in scores.items() if doc in clause_scores}
+        hits = heapq.nlargest(limit, scores.items(), key=lambda hit: (hit[1], -hit[0]))
+        return [(score, *self.docs[doc][:4]) for doc, score in hits]
+
+    def compact(self):
+        """Merges every segment into one, leaving out the postings of documents that were replaced"""
+        self.flush()
+        merged = {}
+        for name in self.segments:
+            header, _ = self._segment(name)
+            for term in header['terms']:
+                if term in merged:
+                    continue
+                for field, doc, positions in self._term_postings(term):
+                    merged.setdefault(term, {}).setdefault(field, {})[doc] = positions
+        old_segments = self.segments
+        self._postings = merged
+        self.segments = []
+        self.flush()
+        self._close_segments()
+        for name in old_segments:
+            os.remove(os.path.join(self.directory, name))
+
+    def _close_segments(self):
+        for _, mapped, data in self._open_segments.values():
+            data.release()
+            mapped.close()
+        self._open_segments = {}
+
+    def close(self):
+        if not self.read_only:
+            if self._findings:
+                self.end_report(self._findings[0].report)
+            self.flush()
+        self._close_segments()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def extract_report(filepath, severities=SEVERITIES, backend=None, cache=None, attachments_dir=None,
+                   vocabulary=DEFAULT_VOCABULARY, stop_early=False):
+    """Returns the list of findings of one report, streaming it when it is large"""
+    # Cached findings come without their attachments, so decoding them means reading the report again
+    if cache is not None and attachments_dir is None and os.path.isfile(filepath):
+        key = cache.key(filepath, severities, vocabulary, stop_early)
+        findings = cache.get(key, vocabulary.names)
+        if findings is None:
+            findings = extract_report(filepath, severities, backend, vocabulary=vocabulary, stop_early=stop_early)
+            cache.put(key, findings)
+        for finding in findings:
+            # Entries are keyed by content, an identical copy of the report may have been cached under another path
+            finding.report = filepath
+        return findings
+    return list(iter_report_findings(filepath, severities, backend, stop_early, attachments_dir, vocabulary))
+
+
+def document_size(filepath):
+    """Returns the size of the WordprocessingML document of a report, uncompressed for a .docx"""
+    if zipfile.is_zipfile(filepath):
+        with zipfile.ZipFile(filepath) as package:
+            try:
+                return package.getinfo('word/document.xml').file_size
+            except KeyError:
+                pass  # XmlParser reports the missing part
+    return os.path.getsize(filepath)
+
+
+def iter_report_findings(filepath, severities=SEVERITIES, backend=None, stop_early=False, attachments_dir=None,
+                         vocabulary=DEFAULT_VOCABULARY):
+    """Yields the findings of one report, straight off iterparse when the report is large.
+
+    With stop_early, the rest of the report is not read once its last requested severity section has ended,
+    which misses the findings of a severity section that appears a second time further on. Embedded images are
+    never parsed, with attachments_dir they are decoded into files there.
+    """
+    streaming = os.path.isfile(filepath) and document_size(filepath) > STREAMING_THRESHOLD
+    # Asking for some severities only lets the parser skip the other sections, and appendices, unparsed
+    sections = severities if set(severities) != set(SEVERITIES) else None
+    parser = XmlParser(filepath, streaming=streaming, backend=backend, severities=sections, skip_binary=True,
+                       attachments_dir=attachments_dir, vocabulary=vocabulary)
+    if parser.streaming:
+        # Large exports are streamed so the whole tree never sits in memory
+        return parser.stream_findings(severities, stop_early)
+    parser.clean_document()
+    return parser.iter_findings(severities, stop_early)
+
+
+def _extract_report_task(filepath, severities, backend, cache_dir=None, attachments_dir=None,
+                         vocabulary=DEFAULT_VOCABULARY, state_dir=None, stop_early=False):
+    """Batch worker, returns (filepath, findings, error) so one broken report does not stop the run"""
+    try:
+        if state_dir is not None:
+            return filepath, extract_report_delta(filepath, DeltaState(state_dir), severities, backend, vocabulary), None
+        cache = ResultCache(cache_dir) if cache_dir else None
+        if attachments_dir is not None:
+            # One attachments directory per report, named after it
+            attachments_dir = os.path.join(attachments_dir, os.path.basename(filepath))
+        return filepath, extract_report(filepath, severities, backend, cache, attachments_dir, vocabulary,
+                                        stop_early), None
+    except Exception as e:
+        return filepath, None, str(e)
+
+
+def collect_reports(paths):
+    """Expands directories and glob patterns into report files, largest first"""
+    reports = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                reports.update(os.path.join(dirpath, name) for name in filenames)
+        else:
+            reports.update(match for match in glob.glob(path, recursive=True) if os.path.isfile(match))
+    reports = [report for report in reports if report.lower().endswith(REPORT_EXTENSIONS)]
+    # Largest first, so the big stragglers start early instead of holding up the end of the run
+    return sorted(reports, key=lambda report: (-os.path.getsize(report), report))
+
+
+def run_batch(paths, severities=SEVERITIES, backend=None, workers=None, cache_dir=None, attachments_dir=None,
+              vocabulary=DEFAULT_VOCABULARY, state_dir=None, stop_early=False):
+    """Yields (filepath, findings, error) for every report under paths as soon as it has been extracted.
+
+    With state_dir, the findings are the delta of each report since its last run, see extract_report_delta.
+    """
+    reports = collect_reports(paths)
+    workers = min(workers or os.cpu_count() or 1, len(reports) or 1)
+    if workers == 1:
+        for filepath in reports:
+            yield _extract_report_task(filepath, severities, backend, cache_dir, attachments_dir, vocabulary, state_dir,
+                                       stop_early)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Futures are handed to the workers in submission order, which keeps the largest-first schedule
+        futures = [executor.submit(_extract_report_task, filepath, severities, backend, cache_dir, attachments_dir,
+                                   vocabulary, state_dir, stop_early)
+                   for filepath in reports]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Extract findings from XML/.docx reports for import into Canopy")
+    arg_parser.add_argument('paths', nargs='*', help="report files, directories or glob patterns (batch mode)")
+    arg_parser.add_argument('--severity', action='append', choices=SEVERITIES,
+                            help="severity section to extract, can be repeated (default: all)")
+    arg_parser.add_argument('--backend', choices=sorted(BACKENDS),
+                            help="parser backend, expat streams without building any tree (default: lxml if installed)")
+    arg_parser.add_argument('--workers', type=int, help="worker processes in batch mode (default: one per core)")
+    arg_parser.add_argument('--stop-early', action='store_true',
+                            help="stop reading a report once its last requested severity section has ended, "
+                                 "for reports that have each severity section once")
+    arg_parser.add_argument('--cache-dir', help="reuse findings of unchanged reports from this directory")
+    arg_parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+                            help="cache size limit in MB, least recently used entries are evicted (default: %(default)s)")
+    arg_parser.add_argument('--jsonl', metavar='PATH',
+                            help="write one JSON object per finding to PATH ('-' for stdout) instead of printing them")
+    arg_parser.add_argument('--gzip', action='store_true', help="gzip the --jsonl output (default for .gz paths)")
+    arg_parser.add_argument('--sqlite', metavar='PATH', help="store the findings in this SQLite database")
+    arg_parser.add_argument('--query', action='store_true',
+                            help="print the findings stored in --sqlite that match --severity, --cwe, --report, "
+                                 "--title and --since instead of extracting any")
+    arg_parser.add_argument('--cwe', action='append', help="with --query, CWE to match (e.g. CWE-79), can be repeated")
+    arg_parser.add_argument('--report', metavar='PATTERN', help="with --query, glob pattern the report path must match")
+    arg_parser.add_argument('--title', help="with --query, text the finding title must contain")
+    arg_parser.add_argument('--since', metavar='YYYY-MM-DD', type=lambda day: time.mktime(time.strptime(day, '%Y-%m-%d')),
+                            help="with --query, only reports modified on or after this day")
+    arg_parser.add_argument('--search-index', metavar='DIR', help="add the findings to the full-text index in DIR")
+    arg_parser.add_argument('--search', metavar='QUERY',
+                            help='print the best --search-index hits for QUERY (words, "quoted phrases") instead of extracting')
+    arg_parser.add_argument('--limit', type=int, default=10, help="number of --search hits (default: %(default)s)")
+    arg_parser.add_argument('--canopy', metavar='URL',
+                            help="upload the findings to this Canopy endpoint, with the token in $CANOPY_TOKEN")
+    arg_parser.add_argument('--canopy-batch-size', type=int, default=CANOPY_BATCH_SIZE,
+                            help="findings per Canopy request (default: %(default)s)")
+    arg_parser.add_argument('--canopy-concurrency', type=int, default=CANOPY_CONCURRENCY,
+                            help="Canopy requests in flight (default: %(default)s)")
+    arg_parser.add_argument('--dedup', choices=('flag', 'drop'),
+                            help="detect near-duplicate findings across the reports and flag them or leave them out")
+    arg_parser.add_argument('--dedup-threshold', type=float, default=DEDUP_THRESHOLD,
+                            help="estimated text similarity from which findings are duplicates (default: %(default)s)")
+    arg_parser.add_argument('--incremental', metavar='DIR',
+                            help="only output the findings added, changed or removed since each report's last run, "
+                                 "whose finding hashes are kept in DIR")
+    arg_parser.add_argument('--attachments', metavar='DIR',
+                            help="decode embedded images into DIR, one subdirectory per report in batch mode")
+    arg_parser.add_argument('--vocabulary', metavar='PATH',
+                            help='JSON file of attribute synonyms: {"Impact": ["Business Impact", ...], ...}')
+    arg_parser.add_argument('--find', metavar='TITLE',
+                            help="only parse the finding with this title, through a section index kept next to each report")
+    args = arg_parser.parse_args(argv)
+    cache = ResultCache(args.cache_dir, args.cache_size * 1024 * 1024) if args.cache_dir else None
+    vocabulary = AttributeVocabulary.load(args.vocabulary) if args.vocabulary else DEFAULT_VOCABULARY
+    if args.query and not args.sqlite:
+        arg_parser.error("--query needs --sqlite")
+    if args.search and not args.search_index:
+        arg_parser.error("--search needs --search-index")
+    if args.incremental and (args.sqlite or args.search_index or args.attachments):
+        # Those outputs replace the findings of a report as a whole
+        arg_parser.error("--incremental cannot be combined with --sqlite, --search-index or --attachments")
+    if args.search:
+        try:
+            index = FullTextIndex(args.search_index, read_only=True)
+        except ValueError as e:
+            arg_parser.error(str(e))
+        with index:
+            for score, report, position, severity, title in index.search(args.search, args.limit):
+                print(f"{score:8.3f}  {severity:<13}  {report}  {title}")
+        return
+    store = SqliteStore(args.sqlite) if args.sqlite else None
+    sinks = []
+    if args.jsonl:
+        sinks.append(JsonlWriter(args.jsonl, compress=args.gzip or None))
+    if store is not None and not args.query:
+        sinks.append(store)
+    if args.search_index and not args.query:
+        sinks.append(FullTextIndex(args.search_index))
+    uploader = None
+    if args.canopy:
+        uploader = CanopyUploader(args.canopy, os.environ.get('CANOPY_TOKEN'), args.canopy_batch_size,
+                                  args.canopy_concurrency)
+        sinks.append(uploader)
+    if not sinks:
+        sinks.append(PrintSink(show_reports=bool(args.paths) or args.query))
+    sink = sinks[0] if len(sinks) == 1 else TeeSink(sinks)
+    if args.dedup:
+        sink = NearDuplicateFilter(sink, args.dedup_threshold, drop=args.dedup == 'drop')
+    state = DeltaState(args.incremental) if args.incremental else None
+    delivered = []  # Reports whose delta every sink has taken
+    completed = False
+    errors = 0  # Reports that could not be read
+
     try:
-        
-        parser = XmlParser(input_file)
-        parser.remove_hyperlink_tags()
-        parser.extract_high_severity_findings()
-        parser.print_findings()
-        
-        #parser.print_body_elements()
-    except ValueError as e:
-        print(e)
+        if args.query:
+            for finding in store.query(args.severity, args.cwe, args.report, args.title, args.since, vocabulary.names):
+                sink.write(finding)
+        elif args.paths and args.find:
+            severities = tuple(args.severity or SEVERITIES)
+            for filepath in collect_reports(args.paths):
+                try:
+                    finding = lookup_finding(filepath, args.find, args.backend)
+                except Exception as e:  # Like in the batch workers, one broken report does not end the run
+                    print(f"{filepath}: {e}", file=sys.stderr)
+                    errors += 1
+                    continue
+                if finding is not None and finding.severity.value in severities:
+                    sink.write(finding)
+                sink.end_report(filepath)
+        elif args.paths:
+            severities = tuple(args.severity or SEVERITIES)
+            batch = run_batch(args.paths, severities, args.backend, args.workers, args.cache_dir, args.attachments,
+                              vocabulary, args.incremental, args.stop_early)
+            for filepath, findings, error in batch:
+                if error is not None:
+                    print(f"{filepath}: {error}", file=sys.stderr)
+                    errors += 1
+                    continue
+                for finding in findings:
+                    sink.write(finding)
+                sink.end_report(filepath)
+                delivered.append(filepath)
+            if cache is not None:
+                cache.evict()
+            completed = True
+        else:
+            input_file = input("Enter the file name: ")
+            try:
+            
+                if state is not None:
+                    findings = extract_report_delta(input_file, state, ('High',), args.backend, vocabulary)
+                elif cache is not None:
+                    findings = extract_report(input_file, ('High',), args.backend, cache, args.attachments, vocabulary,
+                                              args.stop_early)
+                    cache.evict()
+                else:
+                    findings = iter_report_findings(input_file, ('High',), args.backend, args.stop_early,
+                                                    args.attachments, vocabulary)
+                for finding in findings:
+                    sink.write(finding)
+                sink.end_report(input_file)
+                delivered.append(input_file)
+                completed = True
+            
+                #parser.print_body_elements()
+            except ValueError as e:
+                print(e)
+                errors += 1
+    finally:
+        sink.close()
+        if store is not None and store not in sinks:
+            store.close()
+        # Uploads run on after end_report, so the deltas only count as delivered once the sinks have closed
+        if state is not None and completed:
+            if uploader is not None and uploader.failed:
+                print("Incremental state not updated, the next run outputs the same changes again", file=sys.stderr)
+            else:
+                for filepath in delivered:
+                    state.commit(filepath)
+    # Failures are only reported on stderr along the way, the exit status lets scheduled runs notice them
+    if errors or (uploader is not None and uploader.failed):
+        return 1
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
 
 
 
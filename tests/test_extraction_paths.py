@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# Checks every extraction shortcut against the full tree parse, on reports from benchmarks/generate_report.py
+# Usage: python -m unittest discover tests
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from main import (BACKENDS, DEFAULT_STYLES, SEVERITIES, DeltaState, ExpatParagraphReader, RangeReader, SectionIndex,
+                  XmlParser, extract_report_delta, iter_report_findings, lookup_finding, lxml_etree, scan_sections)
+from generate_report import generate
+
+INSTALLED_BACKENDS = [name for name in BACKENDS if name != 'lxml' or lxml_etree is not None]
+HEADING_MARKERS = DEFAULT_STYLES.markers(('Heading2', 'Heading3', 'Heading4', 'Heading4Char'))
+# Chunk sizes below, around and above PRESCAN_MARGIN, none of them lining up with the markup
+CHUNK_SIZES = (1000, 4099, 65537, 99991)
+
+
+def paragraph_at(data, marker, occurrence):
+    """Returns the (start, stop) byte range of the paragraph holding the given occurrence of marker"""
+    position = -1
+    for _ in range(occurrence + 1):
+        position = data.index(marker, position + 1)
+    start = data.rindex(b'<w:p ', 0, position)
+    return start, data.index(b'</w:p>', position) + len(b'</w:p>')
+
+
+def wrap(data, marker, occurrence, before, after):
+    start, stop = paragraph_at(data, marker, occurrence)
+    return data[:start] + before + data[start:stop] + after + data[stop:]
+
+
+def in_table(data, marker, occurrence):
+    return wrap(data, marker, occurrence, b'<w:tbl><w:tr><w:tc>', b'</w:tc></w:tr></w:tbl>')
+
+
+def in_content_control(data, marker, occurrence):
+    return wrap(data, marker, occurrence, b'<w:sdt><w:sdtContent>', b'</w:sdtContent></w:sdt>')
+
+
+def deleted(data, marker, occurrence):
+    start, _ = paragraph_at(data, marker, occurrence)
+    return data[:start] + b'<w:p w:rsidDel="00D4E5F6" ' + data[start + len(b'<w:p '):]
+
+
+def records(findings):
+    """Returns the records of findings, without the change delta findings carry"""
+    result = []
+    for finding in findings:
+        record = finding.to_record()
+        record.pop('change', None)
+        result.append(record)
+    return result
+
+
+def tree_findings(filepath, severities=SEVERITIES):
+    """The reference: the whole document parsed with ElementTree"""
+    parser = XmlParser(filepath, backend='etree')
+    parser.clean_document()
+    return records(parser.iter_findings(severities))
+
+
+def parser_findings(parser, severities=SEVERITIES):
+    if parser.streaming:
+        return records(parser.stream_findings(severities))
+    parser.clean_document()
+    return records(parser.iter_findings(severities))
+
+
+class ExtractionPathsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        plain_path = os.path.join(cls.directory, 'plain.xml')
+        generate(plain_path, findings=8, appendix_ratio=0, images=1, image_size=4)
+        with open(plain_path, 'rb') as f:
+            plain = f.read()
+        heading2 = b'<w:pStyle w:val="Heading2"/>'
+        heading3 = b'<w:pStyle w:val="Heading3"/>'
+        heading4 = b'<w:pStyle w:val="Heading4"/>'
+        variants = {
+            'plain': plain,
+            # Findings and attributes inside tables, the section headings where the pre-scan can cut
+            'finding_in_table': in_table(in_table(plain, heading3, 3), heading4, 20),
+            # Section headings the pre-scan must not cut at
+            'section_in_table': in_table(plain, heading2, 1),
+            'section_in_content_control': in_content_control(plain, heading2, 2),
+            # Headings the cleanup drops before the findings are read
+            'deleted_finding': deleted(plain, heading3, 5),
+            'deleted_section': deleted(plain, heading2, 2),
+        }
+        cls.reports = {}
+        for name, data in variants.items():
+            path = os.path.join(cls.directory, name + '.xml')
+            with open(path, 'wb') as f:
+                f.write(data)
+            cls.reports[name] = path
+        cls.references = {name: tree_findings(path) for name, path in cls.reports.items()}
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def copy(self, name):
+        """Copies a report into a directory of its own, for the paths that write sidecars next to it"""
+        directory = tempfile.mkdtemp(dir=self.directory)
+        path = os.path.join(directory, name + '.xml')
+        shutil.copyfile(self.reports[name], path)
+        return path
+
+    def test_reports_have_findings(self):
+        for name, reference in self.references.items():
+            with self.subTest(report=name):
+                self.assertGreater(len(reference), 20)
+        self.assertEqual(len(self.references['plain']), 8 * len(SEVERITIES))
+
+    def test_tree_and_streaming_match_reference(self):
+        for name, path in self.reports.items():
+            for backend in INSTALLED_BACKENDS:
+                for streaming in (False, True):
+                    with self.subTest(report=name, backend=backend, streaming=streaming):
+                        parser = XmlParser(path, streaming=streaming, backend=backend, skip_binary=True)
+                        self.assertEqual(parser_findings(parser), self.references[name])
+
+    def test_prescan_matches_reference(self):
+        for name, path in self.reports.items():
+            for severities in (('High',), ('Medium', 'Low'), ('Informational',)):
+                reference = [record for record in self.references[name] if record['severity'] in severities]
+                for backend in INSTALLED_BACKENDS:
+                    with self.subTest(report=name, severities=severities, backend=backend):
+                        parser = XmlParser(path, backend=backend, severities=severities, skip_binary=True)
+                        self.assertEqual(parser_findings(parser, severities), reference)
+
+    def test_prescan_cuts_only_where_sections_are_top_level(self):
+        for name, path in self.reports.items():
+            with self.subTest(report=name):
+                parser = XmlParser(path, streaming=True, backend='etree', severities=('Medium',))
+                if name.startswith('section_in_'):
+                    self.assertIsNone(parser.section_pieces)
+                else:
+                    self.assertIsNotNone(parser.section_pieces)
+
+    def test_scan_is_independent_of_chunk_boundaries(self):
+        for name, path in self.reports.items():
+            with open(path, 'rb') as f:
+                data = f.read()
+            whole = scan_sections(io.BytesIO(data), chunk_size=len(data), markers=HEADING_MARKERS)
+            for chunk_size in CHUNK_SIZES:
+                with self.subTest(report=name, chunk_size=chunk_size):
+                    self.assertEqual(scan_sections(io.BytesIO(data), chunk_size, HEADING_MARKERS), whole)
+
+    def test_scan_flags_nested_headings(self):
+        expected = {'plain': 0, 'finding_in_table': 2, 'section_in_table': 1, 'section_in_content_control': 1,
+                    'deleted_finding': 0, 'deleted_section': 0}
+        for name, path in self.reports.items():
+            for chunk_size in CHUNK_SIZES:
+                with self.subTest(report=name, chunk_size=chunk_size), open(path, 'rb') as source:
+                    _, headings, _ = scan_sections(source, chunk_size, HEADING_MARKERS)
+                    self.assertEqual(sum(nested for _, _, nested in headings), expected[name])
+
+    def test_range_reader_reads_pieces_in_any_read_size(self):
+        data = bytes(range(256)) * 40
+        pieces = [b'<head>', (5, 1000), b'', (4000, 4001), b'<mid>', (7000, len(data)), b'<tail>']
+        expected = b'<head>' + data[5:1000] + data[4000:4001] + b'<mid>' + data[7000:] + b'<tail>'
+        for read_size in (1, 3, 7, 1000, 1 << 20):
+            with self.subTest(read_size=read_size):
+                reader = RangeReader(io.BytesIO(data), pieces)
+                self.assertEqual(b''.join(iter(lambda: reader.read(read_size), b'')), expected)
+
+    def test_expat_is_independent_of_chunk_boundaries(self):
+        with open(self.reports['finding_in_table'], 'rb') as f:
+            data = f.read()
+
+        def paragraphs(chunk_size):
+            return [(p.style, p.texts) for p in ExpatParagraphReader().read(io.BytesIO(data), chunk_size)]
+
+        whole = paragraphs(len(data))
+        for chunk_size in (13, 4099, 65537):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(paragraphs(chunk_size), whole)
+
+    def test_section_index_matches_reference(self):
+        for name in ('plain', 'deleted_finding', 'deleted_section'):
+            path = self.copy(name)
+            reference = tree_findings(path)
+            with self.subTest(report=name):
+                index = SectionIndex.open(path)
+                self.assertEqual(index.titles(), [record['title'] for record in reference])
+                self.assertEqual(records(index.parse_findings(index.findings)), reference)
+                self.assertIsNotNone(SectionIndex.load(path))
+                for record in (reference[0], reference[len(reference) // 2], reference[-1]):
+                    for backend in INSTALLED_BACKENDS:
+                        self.assertEqual(records([lookup_finding(path, record['title'], backend)]), [record])
+                self.assertIsNone(lookup_finding(path, "No such finding"))
+
+    def test_section_index_rejects_nested_findings(self):
+        for name in ('finding_in_table', 'section_in_table', 'section_in_content_control'):
+            with self.subTest(report=name):
+                with self.assertRaises(ValueError):
+                    SectionIndex.build(self.copy(name))
+
+    def test_section_index_follows_edits(self):
+        path = self.copy('plain')
+        title = tree_findings(path)[3]['title']
+        lookup_finding(path, title)
+        with open(path, 'rb') as f:
+            data = f.read()
+        stat = os.stat(path)
+        # Same size and modification time, only the hash tells
+        with open(path, 'wb') as f:
+            f.write(data.replace(title.encode('utf-8'), title.upper().encode('utf-8')))
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertIsNone(lookup_finding(path, title))
+        self.assertEqual(records([lookup_finding(path, title.upper())]),
+                         [record for record in tree_findings(path) if record['title'] == title.upper()])
+
+    def test_incremental_delta(self):
+        for name in ('plain', 'finding_in_table', 'deleted_finding'):
+            with self.subTest(report=name):
+                path = self.copy(name)
+                reference = tree_findings(path)
+                state = DeltaState(tempfile.mkdtemp(dir=self.directory))
+                findings = extract_report_delta(path, state)
+                self.assertEqual(records(findings), reference)
+                self.assertEqual({finding.change for finding in findings}, {'added'})
+                # Nothing is committed until the delta has been delivered
+                self.assertEqual(len(extract_report_delta(path, state)), len(reference))
+                state.commit(path)
+                self.assertEqual(extract_report_delta(path, state), [])
+                state.commit(path)
+
+                changed, removed = reference[2], reference[6]
+                with open(path, 'rb') as f:
+                    data = f.read()
+                # Reverse the start of the first paragraph of the finding's Impact, which sits in a single w:t
+                text = changed['attributes']['Impact'][:40].encode('utf-8')
+                position = data.index(text, data.index(changed['title'].encode('utf-8')))
+                data = data[:position] + text[::-1] + data[position + len(text):]
+                data = data.replace(removed['title'].encode('utf-8'), b'Renamed finding', 1)
+                with open(path, 'wb') as f:
+                    f.write(data)
+                delta = extract_report_delta(path, state)
+                changes = sorted((finding.title, finding.change) for finding in delta)
+                self.assertEqual(changes, sorted([(changed['title'], 'changed'), ('Renamed finding', 'added'),
+                                                  (removed['title'], 'removed')]))
+                current = {record['title']: record for record in tree_findings(path)}
+                for finding, record in zip(delta, records(delta)):
+                    if finding.change != 'removed':
+                        self.assertEqual(record, current[finding.title])
+
+    def test_report_findings_match_reference(self):
+        for name, path in self.reports.items():
+            for backend in INSTALLED_BACKENDS:
+                for stop_early in (False, True):
+                    with self.subTest(report=name, backend=backend, stop_early=stop_early):
+                        findings = iter_report_findings(path, ('High', 'Low'), backend, stop_early)
+                        self.assertEqual(records(findings), [record for record in self.references[name]
+                                                             if record['severity'] in ('High', 'Low')])
+
+
+if __name__ == "__main__":
+    unittest.main()